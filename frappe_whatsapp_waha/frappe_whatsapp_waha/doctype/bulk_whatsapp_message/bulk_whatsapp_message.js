@@ -1,7 +1,56 @@
 frappe.ui.form.on('Bulk WhatsApp Message', {
+    onload: function(frm) {
+        // Counter updates are pushed by the server while the campaign runs
+        frappe.realtime.off('whatsapp_campaign_progress');
+        frappe.realtime.on('whatsapp_campaign_progress', function(progress) {
+            if(progress.name !== frm.doc.name) return;
+            show_campaign_progress(frm, progress);
+            if(progress.status !== frm.doc.status) {
+                frm.reload_doc();
+            }
+        });
+    },
     refresh: function(frm) {
         // Add progress bar
         if(frm.doc.docstatus === 1 && frm.doc.status != 'Draft') {
+            show_campaign_progress(frm, {
+                total: frm.doc.recipient_count,
+                sent: frm.doc.sent_count,
+                delivered: frm.doc.delivered_count,
+                read: frm.doc.read_count,
+                failed: frm.doc.failed_count,
+                queued: frm.doc.queued_count,
+                percent: frm.doc.recipient_count ? frm.doc.sent_count / frm.doc.recipient_count * 100 : 0
+            });
+
+            if(['Scheduled', 'Queued', 'In Progress'].includes(frm.doc.status)) {
+                frm.add_custom_button(__('Pause'), function() {
+                    frappe.call({
+                        method: 'frappe_whatsapp_waha.utils.bulk_messaging.pause_campaign',
+                        args: {
+                            name: frm.doc.name
+                        },
+                        callback: function() {
+                            frm.reload_doc();
+                        }
+                    });
+                });
+            }
+
+            if(['Paused', 'Queued', 'In Progress'].includes(frm.doc.status)) {
+                frm.add_custom_button(frm.doc.status === 'Paused' ? __('Resume') : __('Resume Dispatch'), function() {
+                    frappe.call({
+                        method: 'frappe_whatsapp_waha.utils.bulk_messaging.resume_campaign',
+                        args: {
+                            name: frm.doc.name
+                        },
+                        callback: function() {
+                            frm.reload_doc();
+                        }
+                    });
+                });
+            }
+
             frm.add_custom_button(__('Check Progress'), function() {
                 frappe.call({
                     method: 'frappe_whatsapp_waha.utils.bulk_messaging.get_progress',
@@ -23,6 +72,8 @@ frappe.ui.form.on('Bulk WhatsApp Message', {
                                 </div>
                                 <div class="mt-2">
                                     <span class="badge badge-success">Sent: ${progress.sent}</span>
+                                    <span class="badge badge-primary ml-2">Delivered: ${progress.delivered}</span>
+                                    <span class="badge badge-primary ml-2">Read: ${progress.read}</span>
                                     <span class="badge badge-danger ml-2">Failed: ${progress.failed}</span>
                                     <span class="badge badge-warning ml-2">Queued: ${progress.queued}</span>
                                     <span class="badge badge-info ml-2">Total: ${progress.total}</span>
@@ -79,3 +130,14 @@ frappe.ui.form.on('Bulk WhatsApp Message', {
         return true;
     }
 });
+
+function show_campaign_progress(frm, progress) {
+    frm.dashboard.show_progress(
+        __('Sending'),
+        progress.percent,
+        __('Sent {0}, Delivered {1}, Read {2}, Failed {3}, Queued {4} of {5}', [
+            progress.sent, progress.delivered, progress.read,
+            progress.failed, progress.queued, progress.total
+        ])
+    );
+}
@@ -4,10 +4,90 @@
 import frappe
 from frappe import _
 import json
-from frappe.utils import cint, get_datetime, now
+from frappe.utils import cint, get_datetime, now, now_datetime, to_timedelta
 from frappe.model.document import Document
 from frappe.model.naming import make_autoname
 
+from frappe_whatsapp_waha.utils import campaign_counters, outbox
+from frappe_whatsapp_waha.utils.campaign_render import CampaignRenderer, RenderError, iter_recipients
+from frappe_whatsapp_waha.utils.number_check import get_cached_statuses
+from frappe_whatsapp_waha.utils.phone import deduplicate, get_default_country_code, normalise
+from frappe_whatsapp_waha.utils.recipients import (
+    count_recipients,
+    fetch_recipient_page,
+    get_chunk_size,
+    get_recipient_source,
+)
+from frappe_whatsapp_waha.utils.suppression import is_suppressed
+
+CHUNK_METHOD = (
+    "frappe_whatsapp_waha.frappe_whatsapp_waha.doctype.bulk_whatsapp_message"
+    ".bulk_whatsapp_message.process_chunk"
+)
+RESUME_METHOD = (
+    "frappe_whatsapp_waha.frappe_whatsapp_waha.doctype.bulk_whatsapp_message"
+    ".bulk_whatsapp_message.resume_dispatch"
+)
+RETRY_METHOD = (
+    "frappe_whatsapp_waha.frappe_whatsapp_waha.doctype.bulk_whatsapp_message"
+    ".bulk_whatsapp_message.retry_chunk"
+)
+
+# Header fields needed to build messages; the recipients table is never loaded
+CAMPAIGN_FIELDS = (
+    "name",
+    "docstatus",
+    "status",
+    "recipient_type",
+    "recipient_list",
+    "recipient_count",
+    "use_template",
+    "template",
+    "variable_type",
+    "template_variables",
+    "attach",
+)
+
+# Columns written for every campaign message
+MESSAGE_FIELDS = (
+    "name",
+    "creation",
+    "modified",
+    "owner",
+    "modified_by",
+    "docstatus",
+    "idx",
+    "type",
+    "status",
+    "to",
+    "use_template",
+    "template",
+    "message_type",
+    "content_type",
+    "attach",
+    "body_param",
+    "template_parameters",
+    "message",
+    "chat_id",
+    "media_link",
+    "is_reply",
+    "bulk_message_reference",
+    "priority_lane",
+    "idempotency_key",
+    "failed_at",
+)
+
+# Fields driving scheduled and drip-rate release
+PACING_FIELDS = (
+    "scheduled_time",
+    "drip_rate",
+    "send_window_start",
+    "send_window_end",
+    "released_count",
+    "release_cursor",
+    "release_finished",
+)
+
 # Add these files to your frappe_whatsapp_waha app
 
 # 1. First, create a new DocType for Bulk WhatsApp Messaging
@@ -21,6 +101,10 @@ class BulkWhatsAppMessage(Document):
     def validate(self):
         # self.validate_message()
         self.validate_recipients()
+        self.validate_schedule()
+
+    def before_update_after_submit(self):
+        self.validate_schedule()
     
     def validate_message(self):
         if not self.message_content:
@@ -32,133 +116,490 @@ class BulkWhatsAppMessage(Document):
         
         # If recipient list is provided, count recipients
         if self.recipient_type == 'Recipient List' and self.recipient_list:
-            recipient_count = frappe.db.count("WhatsApp Recipient", {"parent": self.recipient_list})
+            # Counts the matching source records for a dynamic segment
+            recipient_count = count_recipients(self.recipient_list)
             if recipient_count == 0:
                 frappe.throw(_("Selected recipient list has no recipients"))
             self.recipient_count = recipient_count
         # If individual recipients are provided
         elif self.recipients:
+            self.normalise_recipients()
             self.recipient_count = len(self.recipients)
+
+    def normalise_recipients(self):
+        """Store the numbers of the recipients table as E.164 digits, each number once
+
+        Invalid numbers are kept as entered and fail when their message is
+        rendered.
+        """
+        country_code = get_default_country_code()
+        for row in self.recipients:
+            row.mobile_number = normalise(row.mobile_number, country_code) or row.mobile_number
+
+        recipients = list(deduplicate(self.recipients, country_code=country_code))
+        for idx, row in enumerate(recipients, start=1):
+            row.idx = idx
+        self.set("recipients", recipients)
+
+    def validate_schedule(self):
+        if cint(self.drip_rate) < 0:
+            frappe.throw(_("Drip rate cannot be negative"))
+
+        if bool(self.send_window_start) != bool(self.send_window_end):
+            frappe.throw(_("Set both the start and the end of the send window"))
     
     def on_submit(self):
+        if self.is_scheduled_for_later():
+            # Started by the campaign scheduler once the time has come
+            self.db_set("status", "Scheduled")
+            return
+
         self.db_set("status", "Queued")
-        self.queue_messages()
+        if not is_paced(self):
+            self.queue_messages()
+
+    def is_scheduled_for_later(self):
+        return bool(self.scheduled_time) and get_datetime(self.scheduled_time) > now_datetime()
+
+    def pause(self):
+        """Stop releasing recipients until the campaign is resumed
+
+        Messages already handed to the outbox wait there as well.
+        """
+        if self.status not in ("Scheduled", "Queued", "In Progress"):
+            frappe.throw(_("Only scheduled or running campaigns can be paused"))
+
+        self.db_set("status", "Paused")
+
+    def resume(self):
+        """Continue the campaign from its last checkpoint
+
+        Works for paused campaigns as well as for running ones whose jobs
+        were lost to a worker restart or a deploy.
+        """
+        if self.status not in ("Paused", "Queued", "In Progress"):
+            frappe.throw(_("Only paused or running campaigns can be resumed"))
+
+        if self.status == "Paused":
+            if self.is_scheduled_for_later():
+                self.db_set("status", "Scheduled")
+                return
+
+            released_count = frappe.db.get_value(self.doctype, self.name, "released_count")
+            self.db_set("status", "In Progress" if cint(released_count) else "Queued")
+
+        frappe.enqueue(
+            RESUME_METHOD,
+            queue="long",
+            timeout=4000,
+            job_id=f"whatsapp_campaign_resume:{self.name}",
+            deduplicate=True,
+            enqueue_after_commit=True,
+            campaign=self.name,
+        )
     
     def queue_messages(self):
-        """Queue messages for sending"""
-        if self.recipient_type == 'Recipient List' and self.recipient_list:
-            # Fetch recipients from the recipient list
-            recipients = frappe.get_all(
-                "WhatsApp Recipient", 
-                filters={"parent": self.recipient_list},
-                fields=["mobile_number", "name", "recipient_name", "recipient_data"]
-            )
-            
-            for recipient in recipients:
-                frappe.enqueue_doc(
-                    self.doctype, self.name,
-                    "create_single_message",
-                    "long", 4000,
-                    recipient=recipient
-                )
-        else:
-            # Use recipients from the current document
-            for recipient in self.recipients:
-                frappe.enqueue_doc(
-                    self.doctype, self.name,
-                    "create_single_message",
-                    "long", 4000,
-                    recipient=recipient
-                )
+        """Queue messages for sending
+
+        Only the first chunk job is enqueued here; every chunk job enqueues
+        the one after it, so submitting costs the same for any list size.
+        """
+        enqueue_chunk(self.name)
     
     def create_single_message(self, recipient):
-        """Create a single message in the queue"""
-        # message_content = self.message_content
-        
-        # Replace variables in the message if any
-        self.status == "In Progress"
-        if recipient.get("recipient_data"):
-            try:
-                variables = json.loads(recipient.get("recipient_data", "{}"))
-                # for var_name, var_value in variables.items():
-                #     message_content = message_content.replace(f"{{{{{var_name}}}}}", str(var_value))
-            except Exception as e:
-                frappe.log_error(f"Error parsing recipient data: {str(e)}", "WhatsApp Bulk Messaging")
-        
-        # Create WhatsApp message
-        wa_message = frappe.new_doc("WhatsApp Message")
-        # wa_message.from_number = self.from_number
-        wa_message.to = recipient.get("mobile_number")
-        wa_message.message_type = "Text"
-        # wa_message.message = message_content
-        wa_message.flags.custom_ref_doc = json.loads(recipient.get("recipient_data", "{}"))
-        wa_message.bulk_message_reference = self.name
-        
-        # If template is being used
-        if self.use_template:
-            wa_message.template = self.template
-            wa_message.message_type = 'Template'
-            wa_message.use_template = self.use_template
-            # Handle template variables if needed
-
-            if recipient.get("recipient_data") and self.variable_type=='Unique':
-                wa_message.body_param = recipient.get("recipient_data")
-            elif self.template_variables and self.variable_type=='Common':
-                wa_message.body_param = self.template_variables
-            if self.attach:
-                wa_message.attach = self.attach
-        
-        # Set status to queued
-        wa_message.status = "Queued"
-        try:
-            wa_message.insert(ignore_permissions=True)
-        except Exception:
-            self.db_set("status", "Partially Failed")
-        # Update message count
-        self.db_set("sent_count", cint(self.sent_count) + 1)
-        if self.recipient_count == self.sent_count:
-            self.db_set("status", "Completed")
+        """Create a single message in the queue (kept for jobs queued before chunking)"""
+        insert_messages(self, [recipient])
 
     def retry_failed(self):
-        """Retry failed messages"""
-        failed_messages = frappe.get_all(
-            "WhatsApp Message",
-            filters={
-                "bulk_message_reference": self.name,
-                "status": "Failed"
-            },
-            fields=["name"]
-        )
-        
-        count = 0
-        for msg in failed_messages:
-            message_doc = frappe.get_doc("WhatsApp Message", msg.name)
-            message_doc.status = "Queued"
-            message_doc.save(ignore_permissions=True)
-            count += 1
-        
+        """Retry failed messages
+
+        Failed messages are requeued and sent again chunk by chunk in the
+        background. Only rows still marked Failed are picked up, so running
+        it again never sends a message twice.
+        """
+        if self.docstatus != 1:
+            frappe.throw(_("Only submitted bulk messages can be retried"))
+        if self.status == "Paused":
+            frappe.throw(_("Resume the bulk message before retrying failed messages"))
+
+        count = frappe.db.count("WhatsApp Message", {"bulk_message_reference": self.name, "status": "Failed"})
+        if count:
+            enqueue_retry_chunk(self.name)
+
         frappe.msgprint(_("{0} messages have been requeued for sending").format(count))
+        return count
         
     def get_progress(self):
         """Get sending progress for this bulk message"""
-        total = self.recipient_count
-        sent = frappe.db.count("WhatsApp Message", {
-            "bulk_message_reference": self.name,
-            "status": ["in", ["sent","delivered", "Success", "read"]]
-        })
-        failed = frappe.db.count("WhatsApp Message", {
-            "bulk_message_reference": self.name,
-            "status": "Failed"
-        })
-        queued = frappe.db.count("WhatsApp Message", {
-            "bulk_message_reference": self.name,
-            "status": "Queued"
-        })
-        
-        return {
-            "total": total,
-            "sent": sent,
-            "failed": failed,
-            "queued": queued,
-            "percent": (sent / total * 100) if total else 0
+        return campaign_counters.get_progress(self.name)
+
+
+def enqueue_chunk(campaign, after=None):
+    """Enqueue the chunk job handling the recipients after row ``after``"""
+    frappe.enqueue(
+        CHUNK_METHOD,
+        queue="long",
+        timeout=4000,
+        job_id=f"whatsapp_campaign_chunk:{campaign}:{after or ''}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        campaign=campaign,
+        after=after,
+    )
+
+
+def process_chunk(campaign, after=None):
+    """Create the messages for one page of recipients
+
+    The next chunk is enqueued once this page is committed, so pages are
+    released strictly in order: the last page is only marked released when
+    every page before it is in, and the release cursor never skips a page.
+    Sending is spread over the dispatcher workers, and Redis only ever
+    holds one small job per campaign.
+    """
+    header = frappe.db.get_value("Bulk WhatsApp Message", campaign, CAMPAIGN_FIELDS, as_dict=True)
+    if not header or header.docstatus != 1:
+        return
+
+    if header.status == "Paused":
+        # The chain stops here; resume() enqueues it again from this page
+        mark_released(campaign, after, 0)
+        return
+
+    if not after and not validate_before_release(header):
+        return
+
+    chunk_size = get_chunk_size()
+    parenttype, parent = get_recipient_source(header)
+    page = fetch_recipient_page(parenttype, parent, after=after, limit=chunk_size)
+
+    last = len(page) < chunk_size
+    release_page(header, page, last=last)
+    if not last:
+        enqueue_chunk(campaign, page[-1].name)
+
+
+def resume_dispatch(campaign):
+    """Pick a campaign up from its last checkpoint
+
+    Messages left in flight are reconciled with WAHA rather than sent
+    again, pending messages go back to the dispatcher and the chunk chain
+    restarts at the release cursor. Paced campaigns are released by the
+    next scheduler tick instead.
+    """
+    header = frappe.db.get_value(
+        "Bulk WhatsApp Message", campaign, [*CAMPAIGN_FIELDS, *PACING_FIELDS], as_dict=True
+    )
+    if not header or header.docstatus != 1 or header.status not in ("Queued", "In Progress"):
+        return
+
+    outbox.reconcile_in_flight(campaign)
+
+    if not is_paced(header) and not cint(header.release_finished):
+        enqueue_chunk(campaign, header.release_cursor)
+
+    outbox.start_dispatchers()
+
+
+def enqueue_retry_chunk(campaign, after=None, *, after_commit=True):
+    """Enqueue the retry job handling the failed messages after ``after``"""
+    frappe.enqueue(
+        RETRY_METHOD,
+        queue="long",
+        timeout=4000,
+        job_id=f"whatsapp_campaign_retry:{campaign}:{after or ''}",
+        deduplicate=True,
+        enqueue_after_commit=after_commit,
+        campaign=campaign,
+        after=after,
+    )
+
+
+def retry_chunk(campaign, after=None):
+    """Requeue one page of failed messages and send them again
+
+    Each message is rendered again with the campaign's current template,
+    variables and attachment from the parameters stored on its row, so a
+    retried message is sent as pre-rendered like any other campaign
+    message. The page is written in one bulk UPDATE and committed before
+    the dispatcher sends it. Messages that still cannot be rendered, or
+    that fail again, keep their place behind the cursor and wait for the
+    next retry.
+    """
+    header = frappe.db.get_value("Bulk WhatsApp Message", campaign, CAMPAIGN_FIELDS, as_dict=True)
+    if not header or header.docstatus != 1 or header.status == "Paused":
+        return
+
+    try:
+        renderer = CampaignRenderer(header)
+    except RenderError as e:
+        frappe.log_error(f"Cannot retry Bulk WhatsApp Message {campaign}: {e}", "WhatsApp Bulk Messaging")
+        return
+
+    chunk_size = get_chunk_size()
+    failed = frappe.db.sql(
+        """
+        SELECT name, `to`, chat_id, body_param
+        FROM `tabWhatsApp Message`
+        WHERE bulk_message_reference = %(campaign)s
+            AND status = 'Failed'
+            AND name > %(after)s
+        ORDER BY name
+        LIMIT %(limit)s
+        FOR UPDATE
+        """,
+        {"campaign": campaign, "after": after or "", "limit": chunk_size},
+        as_dict=True,
+    )
+    if not failed:
+        return
+
+    if len(failed) == chunk_size:
+        enqueue_retry_chunk(campaign, failed[-1].name, after_commit=False)
+
+    updates = {}
+    for message in failed:
+        try:
+            rendered = renderer.rerender(message.chat_id or message.to, message.body_param)
+        except RenderError as e:
+            frappe.log_error(f"Cannot render message for {message.to}: {e}", "WhatsApp Bulk Messaging")
+            continue
+
+        updates[message.name] = {
+            "status": "Queued",
+            "template": header.template if header.use_template else None,
+            "attach": header.attach if header.use_template else None,
+            "body_param": rendered.body_param,
+            "template_parameters": json.dumps(list(rendered.parameters)) if rendered.parameters else None,
+            "message": rendered.text,
+            "chat_id": rendered.chat_id,
+            "media_link": rendered.media_link,
+            "content_type": rendered.content_type,
         }
+    if not updates:
+        return
+
+    frappe.db.bulk_update("WhatsApp Message", updates, chunk_size=chunk_size)
+
+    campaign_counters.add(campaign, failed_count=-len(updates), queued_count=len(updates))
+    if header.status != "In Progress":
+        frappe.db.set_value("Bulk WhatsApp Message", campaign, "status", "In Progress", update_modified=False)
+    frappe.db.commit()
+
+    outbox.start_dispatchers()
+
+
+def validate_before_release(campaign):
+    """Render every recipient before the first message of ``campaign`` is written
+
+    This runs in the first release job rather than on submit, so that
+    submitting costs the same for any list size. If any recipient cannot be
+    rendered the campaign is marked Failed and nothing is sent; the errors
+    are in the Error Log. Returns whether the campaign may be released.
+    """
+    try:
+        CampaignRenderer(campaign).validate(iter_recipients(campaign))
+    except frappe.ValidationError as e:
+        frappe.clear_messages()
+        frappe.log_error(
+            f"Bulk WhatsApp Message {campaign.name} was not sent: {e}", "WhatsApp Bulk Messaging"
+        )
+        frappe.db.set_value("Bulk WhatsApp Message", campaign.name, "status", "Failed", update_modified=False)
+        return False
+    return True
+
+
+def release_page(campaign, page, last=False):
+    """Create the messages for ``page`` and advance the release cursor
+
+    ``last`` marks the final page of the recipients.
+    """
+    if campaign.status in ("Scheduled", "Queued"):
+        frappe.db.set_value("Bulk WhatsApp Message", campaign.name, "status", "In Progress", update_modified=False)
+
+    released = insert_messages(campaign, page)
+    if page or last:
+        mark_released(campaign.name, page[-1].name if page else None, released, last=last)
+
+
+def mark_released(campaign, cursor, count, last=False):
+    """Record ``count`` more released recipients, the last one being ``cursor``
+
+    The cursor only ever moves forward, so a page released again after a
+    crash cannot move it back. Once the last page is out the recipient
+    count is set to the number actually released, since a list or dynamic
+    segment may have changed since the campaign was submitted, and the
+    campaign may complete.
+    """
+    if not cursor and not count and not last:
+        return
+
+    frappe.db.sql(
+        """
+        UPDATE `tabBulk WhatsApp Message`
+        SET
+            released_count = released_count + %(count)s,
+            release_cursor = IF(
+                %(cursor)s IS NOT NULL AND (release_cursor IS NULL OR release_cursor < %(cursor)s),
+                %(cursor)s,
+                release_cursor
+            ),
+            -- assignments apply left to right, so these see the new values
+            release_finished = release_finished OR %(last)s,
+            recipient_count = IF(release_finished, released_count, recipient_count)
+        WHERE name = %(name)s
+        """,
+        {"name": campaign, "cursor": cursor, "count": count, "last": int(last)},
+    )
+    if last:
+        # all messages of the earlier pages may have settled already
+        campaign_counters.complete(campaign)
+
+
+def is_paced(campaign):
+    """Whether recipients are released by the scheduler rather than all at once"""
+    return bool(cint(campaign.get("drip_rate")) or campaign.get("send_window_start"))
+
+
+def in_send_window(start, end, at=None):
+    """Whether ``at`` (default: now) falls in the daily window from ``start`` to ``end``"""
+    if not start or not end:
+        return True
+
+    start, end = to_timedelta(start), to_timedelta(end)
+    current = to_timedelta((at or now_datetime()).time())
+
+    if start <= end:
+        return start <= current < end
+    # window spanning midnight
+    return current >= start or current < end
+
+
+def insert_messages(campaign, recipients):
+    """Write the WhatsApp Messages for ``recipients`` with multi-row inserts
+
+    Each message is rendered here, so its row holds the final text, media
+    link and chat id and the dispatcher only has to send it. Rows carry
+    the same fields and statuses a regular insert would give them but skip
+    the document lifecycle (validation, doc event hooks and server
+    scripts), so that a page costs a few statements instead of one full
+    insert per recipient. Recipients that cannot be rendered, e.g. after
+    the list changed since submission, or whose number is known not to be
+    on WhatsApp, are stored as Failed, and those on the suppression list
+    as Suppressed.
+
+    Recipients that already have their message, e.g. on a page released
+    again after a crash, are skipped, and so are numbers that already got
+    a message from the campaign through another recipient row, e.g. when
+    two records of a dynamic segment share a number. Returns the number of
+    messages written.
+    """
+    if not recipients:
+        return 0
+
+    renderer = CampaignRenderer(campaign)
+    timestamp = now()
+    user = frappe.session.user
+    rows = []
+    queued = failed = 0
+
+    rendered_page = []
+    for recipient in recipients:
+        try:
+            rendered = renderer.render(recipient)
+        except RenderError as e:
+            frappe.log_error(
+                f"Cannot render message for {recipient.get('mobile_number')}: {e}", "WhatsApp Bulk Messaging"
+            )
+            rendered = None
+        rendered_page.append((recipient, rendered))
+
+    # one cache read for the page; numbers never checked are sent as usual
+    number_statuses = get_cached_statuses(
+        rendered.chat_id.split("@", 1)[0] for _recipient, rendered in rendered_page if rendered
+    )
+
+    # the campaign row lock keeps concurrent releases of the same recipients
+    # apart, and the locking read sees messages they committed meanwhile
+    frappe.db.get_value("Bulk WhatsApp Message", campaign.name, "name", for_update=True)
+    keys = [idempotency_key(campaign.name, r.get("name")) for r in recipients if r.get("name")]
+    existing = set()
+    if keys:
+        existing = set(frappe.db.sql_list(
+            "SELECT idempotency_key FROM `tabWhatsApp Message` WHERE idempotency_key IN %(keys)s FOR UPDATE",
+            {"keys": tuple(keys)},
+        ))
+
+    numbers = {rendered.chat_id.split("@", 1)[0] for _recipient, rendered in rendered_page if rendered}
+    messaged = set()
+    if numbers:
+        messaged = set(frappe.db.sql_list(
+            "SELECT `to` FROM `tabWhatsApp Message` WHERE bulk_message_reference = %(campaign)s AND `to` IN %(numbers)s",
+            {"campaign": campaign.name, "numbers": tuple(numbers)},
+        ))
+
+    for recipient, rendered in rendered_page:
+        if recipient.get("name") and idempotency_key(campaign.name, recipient.get("name")) in existing:
+            continue
+
+        if rendered:
+            number = rendered.chat_id.split("@", 1)[0]
+            if number in messaged:
+                continue
+            messaged.add(number)
+
+        number_status = number_statuses.get(rendered.chat_id.split("@", 1)[0]) if rendered else None
+        if not rendered or (number_status and not number_status["exists"]):
+            status = "Failed"
+        elif is_suppressed(rendered.chat_id):
+            status = "Suppressed"
+        else:
+            status = "Queued"
+
+        if status == "Queued":
+            queued += 1
+        else:
+            failed += 1
+
+        rows.append((
+            frappe.generate_hash(length=10),
+            timestamp,
+            timestamp,
+            user,
+            user,
+            0,
+            0,
+            "Outgoing",
+            status,
+            rendered.chat_id.split("@", 1)[0] if rendered else recipient.get("mobile_number"),
+            cint(campaign.use_template),
+            campaign.template if campaign.use_template else None,
+            "Template" if campaign.use_template else "Manual",
+            rendered.content_type if rendered else "text",
+            campaign.attach if campaign.use_template else None,
+            rendered.body_param if rendered else None,
+            json.dumps(list(rendered.parameters)) if rendered and rendered.parameters else None,
+            rendered.text if rendered else None,
+            rendered.chat_id if rendered else None,
+            rendered.media_link if rendered else None,
+            0,
+            campaign.name,
+            "Campaign",
+            idempotency_key(campaign.name, recipient.get("name")) if recipient.get("name") else None,
+            timestamp if status == "Failed" else None,
+        ))
+
+    if not rows:
+        return 0
+
+    frappe.db.bulk_insert("WhatsApp Message", fields=MESSAGE_FIELDS, values=rows)
+
+    campaign_counters.add(campaign.name, queued_count=queued, failed_count=failed)
+    if queued:
+        outbox.kick_dispatcher()
+    return len(rows)
+
+
+def idempotency_key(campaign, recipient):
+    """Key of the message sent to recipient row ``recipient`` by ``campaign``"""
+    return f"{campaign}:{recipient}"
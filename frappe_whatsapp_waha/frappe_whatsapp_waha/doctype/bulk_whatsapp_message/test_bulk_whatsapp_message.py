@@ -1,9 +1,141 @@
 # Copyright (c) 2025, djs4000 and Contributors
 # See license.txt
 
-# import frappe
+from datetime import datetime
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from frappe_whatsapp_waha.frappe_whatsapp_waha.doctype.bulk_whatsapp_message.bulk_whatsapp_message import (
+	CAMPAIGN_FIELDS,
+	in_send_window,
+	insert_messages,
+)
+from frappe_whatsapp_waha.utils import campaign_counters
+
+
+def at(hour, minute=0):
+	return datetime(2026, 10, 19, hour, minute)
+
+
+def make_campaign(**values):
+	"""Write a submitted campaign row, without running on_submit"""
+	campaign = frappe.get_doc({
+		"doctype": "Bulk WhatsApp Message",
+		"title": "Test Campaign",
+		"recipient_type": "Individual",
+		"status": "Queued",
+		**values,
+	})
+	campaign.name = f"BULK-WA-TEST-{frappe.generate_hash(length=8)}"
+	campaign.docstatus = 1
+	campaign.db_insert()
+	return campaign.name
+
+
+def recipient(name, mobile_number):
+	return frappe._dict(name=name, mobile_number=mobile_number, recipient_data=None)
+
 
 class TestBulkWhatsAppMessage(FrappeTestCase):
-	pass
+	def test_send_window_within_a_day(self):
+		self.assertTrue(in_send_window("09:00:00", "17:00:00", at(9)))
+		self.assertTrue(in_send_window("09:00:00", "17:00:00", at(16, 59)))
+		self.assertFalse(in_send_window("09:00:00", "17:00:00", at(8, 59)))
+		# the end of the window is exclusive
+		self.assertFalse(in_send_window("09:00:00", "17:00:00", at(17)))
+
+	def test_send_window_across_midnight(self):
+		self.assertTrue(in_send_window("22:00:00", "06:00:00", at(22)))
+		self.assertTrue(in_send_window("22:00:00", "06:00:00", at(23, 30)))
+		self.assertTrue(in_send_window("22:00:00", "06:00:00", at(0)))
+		self.assertTrue(in_send_window("22:00:00", "06:00:00", at(5, 59)))
+		self.assertFalse(in_send_window("22:00:00", "06:00:00", at(6)))
+		self.assertFalse(in_send_window("22:00:00", "06:00:00", at(12)))
+
+	def test_no_send_window(self):
+		self.assertTrue(in_send_window(None, None, at(3)))
+		self.assertTrue(in_send_window("09:00:00", None, at(3)))
+
+
+class TestReleaseMessages(FrappeTestCase):
+	def setUp(self):
+		self.campaign = make_campaign(recipient_count=4)
+		self.header = frappe.db.get_value("Bulk WhatsApp Message", self.campaign, CAMPAIGN_FIELDS, as_dict=True)
+
+	def get_messages(self):
+		return frappe.get_all(
+			"WhatsApp Message",
+			filters={"bulk_message_reference": self.campaign},
+			fields=["to", "status", "chat_id"],
+			order_by="`to`",
+		)
+
+	def test_released_page_is_written_once(self):
+		page = [recipient("row-1", "+1 555 010 0201"), recipient("row-2", "+1 555 010 0202")]
+		self.assertEqual(insert_messages(self.header, page), 2)
+		# a page released again after a crash
+		self.assertEqual(insert_messages(self.header, page), 0)
+
+		messages = self.get_messages()
+		self.assertEqual([message.to for message in messages], ["15550100201", "15550100202"])
+		self.assertEqual({message.status for message in messages}, {"Queued"})
+		self.assertEqual(messages[0].chat_id, "15550100201@c.us")
+
+		campaign_counters.flush()
+		self.assertEqual(frappe.db.get_value("Bulk WhatsApp Message", self.campaign, "queued_count"), 2)
+
+	def test_number_is_messaged_once_across_pages(self):
+		self.assertEqual(insert_messages(self.header, [recipient("row-1", "+1 555 010 0203")]), 1)
+		page = [
+			recipient("row-2", "0015550100203"),
+			recipient("row-3", "+1 555 010 0204"),
+			recipient("row-4", "15550100204@c.us"),
+		]
+		self.assertEqual(insert_messages(self.header, page), 1)
+		self.assertEqual([message.to for message in self.get_messages()], ["15550100203", "15550100204"])
+
+	def test_invalid_number_is_stored_as_failed(self):
+		self.assertEqual(insert_messages(self.header, [recipient("row-1", "call me")]), 1)
+		message = self.get_messages()[0]
+		self.assertEqual(message.status, "Failed")
+		self.assertIsNone(message.chat_id)
+
+
+class TestCampaignCompletion(FrappeTestCase):
+	def get_status(self, campaign):
+		return frappe.db.get_value("Bulk WhatsApp Message", campaign, "status")
+
+	def test_completes_once_released_and_settled(self):
+		campaign = make_campaign(recipient_count=3, release_finished=1, sent_count=3)
+		self.assertTrue(campaign_counters.complete(campaign))
+		self.assertEqual(self.get_status(campaign), "Completed")
+		# only the call making the transition reports it
+		self.assertFalse(campaign_counters.complete(campaign))
+
+	def test_partially_failed(self):
+		campaign = make_campaign(recipient_count=3, release_finished=1, sent_count=2, failed_count=1)
+		self.assertTrue(campaign_counters.complete(campaign))
+		self.assertEqual(self.get_status(campaign), "Partially Failed")
+
+	def test_waits_for_the_last_page(self):
+		campaign = make_campaign(recipient_count=3, release_finished=0, sent_count=3)
+		self.assertFalse(campaign_counters.complete(campaign))
+		self.assertEqual(self.get_status(campaign), "Queued")
+
+	def test_waits_for_queued_messages(self):
+		campaign = make_campaign(recipient_count=3, release_finished=1, sent_count=2, queued_count=1)
+		self.assertFalse(campaign_counters.complete(campaign))
+		self.assertEqual(self.get_status(campaign), "Queued")
+
+	def test_waits_for_every_recipient(self):
+		campaign = make_campaign(recipient_count=3, release_finished=1, sent_count=2)
+		self.assertFalse(campaign_counters.complete(campaign))
+
+	def test_paused_and_failed_campaigns(self):
+		paused = make_campaign(status="Paused", recipient_count=1, release_finished=1, sent_count=1)
+		self.assertTrue(campaign_counters.complete(paused))
+
+		failed = make_campaign(status="Failed", recipient_count=1, release_finished=1, failed_count=1)
+		self.assertFalse(campaign_counters.complete(failed))
+		self.assertEqual(self.get_status(failed), "Failed")
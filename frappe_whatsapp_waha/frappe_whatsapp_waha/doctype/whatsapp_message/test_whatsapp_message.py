@@ -2,11 +2,145 @@
 # Copyright (c) 2022, djs4000 and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests import UnitTestCase
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import now
+
+from frappe_whatsapp_waha.frappe_whatsapp_waha.doctype.bulk_whatsapp_message.test_bulk_whatsapp_message import (
+    make_campaign,
+)
+from frappe_whatsapp_waha.utils.message_status import advance, normalise_status
+from frappe_whatsapp_waha.utils.outbox import claim_batch, lane_quotas
 
 
 class TestWhatsAppMessage(UnitTestCase):
     """Test whatsapp messages."""
 
-    pass
+    def test_normalise_status(self):
+        self.assertEqual(normalise_status("Success"), "Sent")
+        self.assertEqual(normalise_status("sent"), "Sent")
+        self.assertEqual(normalise_status("SERVER_ACK"), "Sent")
+        self.assertEqual(normalise_status("DEVICE"), "Delivered")
+        self.assertEqual(normalise_status("delivered"), "Delivered")
+        self.assertEqual(normalise_status("PLAYED"), "Read")
+        self.assertEqual(normalise_status("ERROR"), "Failed")
+
+    def test_normalise_status_ack_codes(self):
+        self.assertEqual(normalise_status(0), "Failed")
+        self.assertEqual(normalise_status(2), "Sent")
+        self.assertEqual(normalise_status("3"), "Delivered")
+        self.assertEqual(normalise_status(4), "Read")
+        # pending has not reached the server yet
+        self.assertIsNone(normalise_status(1))
+
+    def test_normalise_unknown_status(self):
+        self.assertIsNone(normalise_status("pending"))
+        self.assertIsNone(normalise_status(None))
+        self.assertIsNone(normalise_status(True))
+
+    def test_advance_moves_forward(self):
+        self.assertEqual(advance("Queued", "SERVER_ACK"), "Sent")
+        self.assertEqual(advance("Sent", "DEVICE"), "Delivered")
+        self.assertEqual(advance("Delivered", "READ"), "Read")
+        self.assertEqual(advance("Queued", "ERROR"), "Failed")
+        self.assertEqual(advance("Failed", "SERVER_ACK"), "Sent")
+
+    def test_advance_never_moves_back(self):
+        self.assertEqual(advance("Read", "DEVICE"), "Read")
+        self.assertEqual(advance("Delivered", "SERVER_ACK"), "Delivered")
+        self.assertEqual(advance("Read", "ERROR"), "Read")
+        self.assertEqual(advance("Sent", 0), "Sent")
+
+    def test_advance_ignores_unknown_receipts(self):
+        self.assertEqual(advance("Sent", "pending"), "Sent")
+        self.assertEqual(advance("success", None), "Sent")
+
+
+def make_queued(lane, count, campaign=None):
+    """Write ``count`` Queued outgoing messages in ``lane`` and return their names."""
+    timestamp = now()
+    names = [frappe.generate_hash(length=10) for _ in range(count)]
+    frappe.db.bulk_insert(
+        "WhatsApp Message",
+        fields=("name", "creation", "modified", "owner", "modified_by", "type", "status", "to", "content_type",
+                "priority_lane", "bulk_message_reference"),
+        values=[
+            (name, timestamp, timestamp, "Administrator", "Administrator", "Outgoing", "Queued", "15550100301",
+             "text", lane, campaign)
+            for name in names
+        ],
+    )
+    return names
+
+
+class TestWhatsAppMessageOutbox(FrappeTestCase):
+    """Test how the dispatcher claims queued messages."""
+
+    def setUp(self):
+        # claim_batch commits, so the rows of each test are removed explicitly
+        self.campaigns = []
+        self.messages = []
+
+    def tearDown(self):
+        frappe.db.delete("WhatsApp Message", {"name": ("in", self.messages or [""])})
+        frappe.db.delete("Bulk WhatsApp Message", {"name": ("in", self.campaigns or [""])})
+        frappe.db.commit()
+
+    def queue(self, lane, count, campaign=None):
+        names = make_queued(lane, count, campaign)
+        self.messages.extend(names)
+        return names
+
+    def campaign(self, **values):
+        name = make_campaign(**values)
+        self.campaigns.append(name)
+        return name
+
+    def claim(self, batch_size):
+        claimed = claim_batch(batch_size)
+        lanes = frappe.get_all(
+            "WhatsApp Message", filters={"name": ("in", claimed or [""])}, pluck="priority_lane"
+        )
+        return {lane: lanes.count(lane) for lane in ("Transactional", "Manual", "Campaign")}
+
+    def test_lane_quotas_add_up(self):
+        self.assertEqual(lane_quotas(13), {"Transactional": 8, "Manual": 4, "Campaign": 1})
+        for batch_size in (1, 7, 50, 101):
+            self.assertEqual(sum(lane_quotas(batch_size).values()), batch_size)
+
+    def test_batch_is_shared_by_weight(self):
+        campaign = self.campaign()
+        self.queue("Transactional", 20)
+        self.queue("Manual", 20)
+        self.queue("Campaign", 20, campaign)
+
+        self.assertEqual(self.claim(13), {"Transactional": 8, "Manual": 4, "Campaign": 1})
+
+    def test_unused_share_goes_to_other_lanes(self):
+        self.queue("Transactional", 2)
+        self.queue("Manual", 20)
+
+        self.assertEqual(self.claim(13), {"Transactional": 2, "Manual": 11, "Campaign": 0})
+
+    def test_paused_campaign_is_not_claimed(self):
+        campaign = self.campaign(status="Paused")
+        names = self.queue("Campaign", 5, campaign)
+
+        self.assertEqual(self.claim(13)["Campaign"], 0)
+        self.assertEqual(
+            set(frappe.get_all("WhatsApp Message", filters={"name": ("in", names)}, pluck="status")), {"Queued"}
+        )
+
+    def test_claimed_messages_are_leased(self):
+        names = self.queue("Manual", 3)
+        claim_batch(13)
+
+        for message in frappe.get_all(
+            "WhatsApp Message",
+            filters={"name": ("in", names)},
+            fields=["status", "dispatched_at", "lease_expires_at", "leased_by"],
+        ):
+            self.assertEqual(message.status, "Sending")
+            self.assertGreater(message.lease_expires_at, message.dispatched_at)
+            self.assertTrue(message.leased_by)
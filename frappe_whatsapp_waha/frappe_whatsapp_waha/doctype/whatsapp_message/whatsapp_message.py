@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Iterable
+from typing import Any
 
 import frappe
 from frappe.model.document import Document
@@ -12,13 +12,20 @@ from frappe_whatsapp_waha.frappe_whatsapp_waha.utils.waha_client import (
     WahaAPIError,
     WahaClient,
 )
+from frappe_whatsapp_waha.utils.campaign_counters import record_transition
+from frappe_whatsapp_waha.utils.message_status import stamp
+from frappe_whatsapp_waha.utils.notification_log import get_log_buffer
+from frappe_whatsapp_waha.utils.outbox import kick_dispatcher, outbox_enabled
+from frappe_whatsapp_waha.utils.phone import normalise
+from frappe_whatsapp_waha.utils.suppression import is_suppressed
+from frappe_whatsapp_waha.utils.template_cache import get_compiled_template
 
 
 class WhatsAppMessage(Document):
     """Send WhatsApp messages via the configured WAHA instance."""
 
     def before_insert(self):
-        """Send the message before the document is saved."""
+        """Send the message before the document is saved, or queue it in the outbox."""
 
         if self.type != "Outgoing":
             return
@@ -26,12 +33,51 @@ class WhatsAppMessage(Document):
         if not self.message_type:
             self.message_type = "Manual"
 
+        if not self.priority_lane:
+            self.priority_lane = "Campaign" if self.bulk_message_reference else "Manual"
+
+        if is_suppressed(self.to):
+            # kept as a record of the attempt, never sent
+            self.status = "Suppressed"
+            return
+
+        # Campaign messages are committed before they are sent so that an
+        # interrupted campaign can be resumed from their states.
+        if outbox_enabled() or self.bulk_message_reference:
+            self._freeze_template_parameters()
+            self.status = "Queued"
+            return
+
+        self.send()
+
+    def validate(self):
+        stamp(self)
+
+    def after_insert(self):
+        if self.type == "Outgoing" and self.status == "Queued":
+            kick_dispatcher()
+
+    def on_update(self):
+        previous = self.get_doc_before_save()
+        self.record_status_change(previous.status if previous else None)
+
+    def record_status_change(self, previous_status: str | None) -> None:
+        """Count the status change on the campaign this message belongs to."""
+
+        if self.type == "Outgoing" and self.bulk_message_reference:
+            record_transition(self.bulk_message_reference, previous_status, self.status)
+
+    def send(self) -> None:
+        """Send the message through WAHA and record the outcome on the document."""
+
         try:
-            if self.message_type == "Template" and not self.message_id:
+            if self.chat_id:
+                self._send_prerendered()
+            elif self.message_type == "Template" and not self.message_id:
                 self._send_template_message()
             else:
                 self._send_standard_message()
-            self.status = "Success"
+            self.status = "Sent"
         except WahaAPIError as exc:
             self.status = "Failed"
             self._log_api_error(exc.payload)
@@ -66,6 +112,37 @@ class WhatsAppMessage(Document):
     # ------------------------------------------------------------------
     # Message preparation helpers
 
+    def _freeze_template_parameters(self) -> None:
+        """Store parameters that are only available while the message is inserted.
+
+        ``flags.custom_ref_doc`` does not survive until the outbox sends the
+        message, so the values are resolved into ``body_param`` up front.
+        """
+
+        if self.message_type != "Template" or self.body_param is not None:
+            return
+
+        if not getattr(self.flags, "custom_ref_doc", None):
+            return
+
+        parameters = self._collect_template_parameters(get_compiled_template(self.template))
+        if parameters:
+            self.body_param = frappe.as_json(
+                {str(idx): value for idx, value in enumerate(parameters, start=1)}
+            )
+
+    def _send_prerendered(self) -> None:
+        """Send the payload rendered when the campaign message was written."""
+
+        client = WahaClient.from_settings()
+        if self.media_link:
+            response = client.send_media_from_url(self.chat_id, self.media_link, caption=self.message or None)
+        else:
+            response = client.send_text(self.chat_id, self.message or "", preview_url=True)
+
+        self.message_id = response.message_id()
+        self._log_api_success(response.data)
+
     def _send_standard_message(self) -> None:
         client = WahaClient.from_settings()
         recipient = self.format_number(self.to)
@@ -87,30 +164,45 @@ class WhatsAppMessage(Document):
         self._log_api_success(response.data)
 
     def _send_template_message(self) -> None:
-        template = frappe.get_doc("WhatsApp Templates", self.template)
-        parameters = self._collect_template_parameters(template)
+        template = get_compiled_template(self.template)
+        message, media_link, parameters = self._render_template(template)
 
         if parameters:
             self.template_parameters = json.dumps(parameters)
 
+        if media_link:
+            self.content_type = "image" if template.header_type == "IMAGE" else "document"
+        else:
+            self.content_type = "text"
+
+        self.notify(message=message, content_type=self.content_type, media_link=media_link)
+
+    def _render_template(self, template) -> tuple[str, str | None, list[Any]]:
+        """Return the text, media link and parameters of a template message."""
+
+        parameters = self._collect_template_parameters(template)
         message_segments: list[str] = []
 
         if template.header_type == "TEXT" and template.header:
-            message_segments.append(self._render_template_text(template.header, parameters))
+            message_segments.append(template.header.render(parameters))
 
-        message_segments.append(self._render_template_text(template.template, parameters))
+        message_segments.append(template.body.render(parameters))
 
         if template.footer:
             message_segments.append(template.footer)
 
-        media_link = self._get_template_media_link(template)
-        if media_link:
-            self.content_type = "image" if template.header_type == "IMAGE" else "document"
-        else:
-            self.content_type = "text"
-
         message = "\n\n".join(filter(None, message_segments))
-        self.notify(message=message, content_type=self.content_type, media_link=media_link)
+        return message, self._get_template_media_link(template), parameters
+
+    def outgoing_content(self) -> tuple[str, bool]:
+        """Return the text (or caption) WAHA is asked to send and whether it carries media."""
+
+        if self.chat_id:
+            return self.message or "", bool(self.media_link)
+        if self.message_type == "Template" and not self.message_id:
+            message, media_link, _parameters = self._render_template(get_compiled_template(self.template))
+            return message, bool(media_link)
+        return self.message or "", self.content_type in {"document", "image", "video", "audio"}
 
     # ------------------------------------------------------------------
     # WAHA interaction
@@ -135,11 +227,9 @@ class WhatsAppMessage(Document):
     # Utilities
 
     def format_number(self, number: str) -> str:
-        """Remove leading + signs from numbers."""
+        """Return ``number`` in E.164 digits; numbers that do not parse only lose a leading +."""
 
-        if number.startswith("+"):
-            return number[1:]
-        return number
+        return normalise(number) or number.lstrip("+")
 
     @frappe.whitelist()
     def send_read_receipt(self):
@@ -153,10 +243,9 @@ class WhatsAppMessage(Document):
         return f"{frappe.utils.get_url()}/{attach.lstrip('/')}"
 
     def _collect_template_parameters(self, template) -> list[Any]:
-        if not template.sample_values:
+        if not template.parameter_fields:
             return []
 
-        field_names = template.field_names.split(",") if template.field_names else template.sample_values.split(",")
         values: list[Any] = []
 
         if self.body_param is not None:
@@ -164,21 +253,15 @@ class WhatsAppMessage(Document):
             values.extend(params)
         elif getattr(self.flags, "custom_ref_doc", None):
             custom_values = self.flags.custom_ref_doc
-            for field_name in field_names:
-                values.append(custom_values.get(field_name.strip()))
+            for field_name in template.parameter_fields:
+                values.append(custom_values.get(field_name))
         else:
             ref_doc = frappe.get_doc(self.reference_doctype, self.reference_name)
-            for field_name in field_names:
-                values.append(ref_doc.get_formatted(field_name.strip()))
+            for field_name in template.parameter_fields:
+                values.append(ref_doc.get_formatted(field_name))
 
         return values
 
-    def _render_template_text(self, template_text: str, parameters: Iterable[Any]) -> str:
-        text = template_text or ""
-        for idx, value in enumerate(parameters, start=1):
-            text = text.replace(f"{{{{{idx}}}}}", frappe.utils.cstr(value))
-        return text
-
     def _get_template_media_link(self, template) -> str | None:
         if template.header_type == "IMAGE":
             if self.attach:
@@ -190,7 +273,7 @@ class WhatsAppMessage(Document):
         return None
 
     def _log_api_error(self, payload: dict[str, Any], *, context: str | None = None):
-        self._append_notification_log(payload, context=context, default_label="Manual Message")
+        self._append_notification_log(payload, context=context, default_label="Manual Message", failed=True)
 
     def _log_api_success(self, payload: dict[str, Any], *, context: str | None = None):
         self._append_notification_log(payload, context=context, default_label="Manual Message")
@@ -201,16 +284,10 @@ class WhatsAppMessage(Document):
         *,
         context: str | None = None,
         default_label: str,
+        failed: bool = False,
     ) -> None:
         template = self._resolve_notification_label(context, default_label=default_label)
-
-        frappe.get_doc(
-            {
-                "doctype": "WhatsApp Notification Log",
-                "template": template,
-                "meta_data": frappe.as_json(payload or {}),
-            }
-        ).insert(ignore_permissions=True)
+        get_log_buffer().append(template, payload, failed=failed)
 
     def _resolve_notification_label(self, context: str | None, *, default_label: str) -> str:
         if context:
@@ -227,6 +304,9 @@ class WhatsAppMessage(Document):
 
 def on_doctype_update():
     frappe.db.add_index("WhatsApp Message", ["reference_doctype", "reference_name"])
+    frappe.db.add_index("WhatsApp Message", ["status", "priority_lane", "creation"])
+    frappe.db.add_index("WhatsApp Message", ["bulk_message_reference", "status", "creation"])
+    frappe.db.add_index("WhatsApp Message", ["sent_at"])
 
 
 @frappe.whitelist()
@@ -6,9 +6,17 @@ import frappe
 from frappe import _dict, _
 from frappe.model.document import Document
 from frappe.utils.safe_exec import get_safe_globals, safe_exec
-from frappe.desk.form.utils import get_pdf_link
 from frappe.utils import add_to_date, nowdate, datetime
 
+from frappe_whatsapp_waha.utils.phone import normalise
+from frappe_whatsapp_waha.utils.print_cache import (
+    get_cached_print_url,
+    get_print_format,
+    render_print_file,
+)
+from frappe_whatsapp_waha.utils.suppression import is_suppressed
+from frappe_whatsapp_waha.utils.template_cache import get_compiled_template
+
 
 class WhatsAppNotification(Document):
     """Notification."""
@@ -46,12 +54,9 @@ class WhatsAppNotification(Document):
             self.condition, get_safe_globals(), dict(doc=self)
         )
 
-        template = frappe.db.get_value(
-            "WhatsApp Templates", self.template,
-            fieldname='*'
-        )
+        template = get_compiled_template(self.template)
 
-        if template and template.language_code:
+        if template.language_code:
             if self.get("_contact_list"):
                 # send simple template without a doc to get field data.
                 self.send_simple_template(template)
@@ -68,6 +73,8 @@ class WhatsAppNotification(Document):
     def send_simple_template(self, template):
         """ send simple template without a doc to get field data """
         for contact in self._contact_list:
+            if is_suppressed(contact):
+                continue
             data = {
                 "messaging_product": "whatsapp",
                 "to": self.format_number(contact),
@@ -80,7 +87,7 @@ class WhatsAppNotification(Document):
                     "components": []
                 }
             }
-            self.content_type = template.get("header_type", "text").lower()
+            self.content_type = (template.header_type or "text").lower()
             self.notify(data)
 
 
@@ -97,10 +104,7 @@ class WhatsAppNotification(Document):
             ):
                 return
 
-        template = default_template or frappe.db.get_value(
-            "WhatsApp Templates", self.template,
-            fieldname='*'
-        )
+        template = default_template or get_compiled_template(self.template)
 
         if template:
             if self.field_name:
@@ -108,6 +112,9 @@ class WhatsAppNotification(Document):
             else:
                 phone_number = phone_no
 
+            if is_suppressed(phone_number):
+                return
+
             data = {
                 "messaging_product": "whatsapp",
                 "to": self.format_number(phone_number),
@@ -143,33 +150,28 @@ class WhatsAppNotification(Document):
                     "parameters": parameters
                 }]
 
+            url = None
             if self.attach_document_print:
-                # frappe.db.begin()
-                key = doc.get_document_share_key()  # noqa
-                frappe.db.commit()
-                print_format = "Standard"
-                doctype = frappe.get_doc("DocType", doc_data['doctype'])
-                if doctype.custom:
-                    if doctype.default_print_format:
-                        print_format = doctype.default_print_format
-                else:
-                    default_print_format = frappe.db.get_value(
-                        "Property Setter",
-                        filters={
-                            "doc_type": doc_data['doctype'],
-                            "property": "default_print_format"
-                        },
-                        fieldname="value"
-                    )
-                    print_format = default_print_format if default_print_format else print_format
-                link = get_pdf_link(
-                    doc_data['doctype'],
-                    doc_data['name'],
-                    print_format=print_format
+                print_format = get_print_format(doc_data.doctype)
+                url = get_cached_print_url(
+                    doc_data.doctype, doc_data.name, print_format, doc_data.modified
                 )
+                if not url:
+                    # Render the print in the background; the job sends the
+                    # message once the file is stored.
+                    frappe.enqueue(
+                        "frappe_whatsapp_waha.frappe_whatsapp_waha.doctype.whatsapp_notification"
+                        ".whatsapp_notification.send_with_document_print",
+                        queue="short",
+                        enqueue_after_commit=True,
+                        notification=self.name,
+                        doctype=doc_data.doctype,
+                        name=doc_data.name,
+                        phone_no=phone_no,
+                    )
+                    return
 
                 filename = f'{doc_data["name"]}.pdf'
-                url = f'{frappe.utils.get_url()}{link}&key={key}'
 
             elif self.custom_attachment:
                 filename = self.file_name
@@ -209,11 +211,11 @@ class WhatsAppNotification(Document):
                         }
                     }]
                 })
-            self.content_type = template.header_type.lower()
+            self.content_type = (template.header_type or "text").lower()
 
-            self.notify(data, doc_data)
+            self.notify(data, doc_data, attach=url)
 
-    def notify(self, data, doc_data=None):
+    def notify(self, data, doc_data=None, attach=None):
         """Notify."""
         try:
             if not self.get("content_type"):
@@ -236,10 +238,13 @@ class WhatsAppNotification(Document):
                 "content_type": self.content_type or "text",
                 "template": self.template,
                 "use_template": 1,
+                "priority_lane": "Transactional",
             }
 
-            if self.attach:
-                message_doc_dict["attach"] = self.attach
+            # the document print or attachment resolved for this document
+            attach = attach or self.attach
+            if attach:
+                message_doc_dict["attach"] = attach
 
             message_doc = frappe.get_doc(message_doc_dict)
 
@@ -285,10 +290,7 @@ class WhatsAppNotification(Document):
 
     def format_number(self, number):
         """Format number."""
-        if (number.startswith("+")):
-            number = number[1:len(number)]
-
-        return number
+        return normalise(number) or number.lstrip("+")
 
     def get_documents_for_today(self):
         """get list of documents that will be triggered today"""
@@ -317,6 +319,17 @@ class WhatsAppNotification(Document):
             # print(doc.name)
 
 
+def send_with_document_print(notification, doctype, name, phone_no=None):
+    """Render the document print once, then send the notification with it."""
+    if not frappe.db.exists(doctype, name):
+        return
+
+    alert = frappe.get_doc("WhatsApp Notification", notification)
+    doc = frappe.get_doc(doctype, name)
+    render_print_file(doc, get_print_format(doctype))
+    alert.send_template_message(doc, phone_no, ignore_condition=True)
+
+
 @frappe.whitelist()
 def call_trigger_notifications():
     """Trigger notifications."""
@@ -3,4 +3,8 @@ from frappe.model.document import Document
 
 
 class WhatsAppRecipient(Document):
-	pass
\ No newline at end of file
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Recipient", ["parent", "reference_name"])
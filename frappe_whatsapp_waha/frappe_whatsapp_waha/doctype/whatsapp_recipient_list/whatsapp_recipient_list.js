@@ -1,4 +1,22 @@
 frappe.ui.form.on('WhatsApp Recipient List', {
+    onload: function(frm) {
+        frappe.realtime.off('whatsapp_recipient_import');
+        frappe.realtime.on('whatsapp_recipient_import', function(data) {
+            if(data.list_name !== frm.doc.name) return;
+            if(data.failed) {
+                frappe.show_alert({
+                    message: __('{0} recipients imported, {1} rows skipped. See the Upload Error Report.', [data.imported, data.failed]),
+                    indicator: 'orange'
+                });
+            } else {
+                frappe.show_alert({
+                    message: __('{0} recipients imported successfully', [data.imported]),
+                    indicator: 'green'
+                });
+            }
+            frm.reload_doc();
+        });
+    },
     refresh: function(frm) {
         frm.fields_dict.import_button.onclick = function() {
             if(!frm.doc.doctype_to_import || !frm.doc.mobile_field) {
@@ -28,14 +46,59 @@ frappe.ui.form.on('WhatsApp Recipient List', {
                     data_fields: frm.doc.data_fields
                 },
                 callback: function(r) {
-                    if(r.message) {
-                        frappe.msgprint(__(`${r.message} recipients imported successfully`));
-                        frm.reload_doc();
-                    }
+                    frappe.show_alert({
+                        message: __('Importing up to {0} records in the background', [r.message || 0]),
+                        indicator: 'blue'
+                    });
+                    frm.reload_doc();
                 }
             });
         };
         
+        if(!frm.is_new() && frm.doc.list_type !== 'Dynamic Segment' && frm.doc.import_from_doctype && frm.doc.doctype_to_import && frm.doc.mobile_field) {
+            frm.add_custom_button(__('Sync Now'), function() {
+                frappe.call({
+                    method: 'frappe_whatsapp_waha.utils.bulk_messaging.sync_recipients',
+                    args: {
+                        list_name: frm.doc.name
+                    },
+                    callback: function() {
+                        frappe.show_alert({
+                            message: __('Syncing recipients in the background'),
+                            indicator: 'blue'
+                        });
+                        frm.reload_doc();
+                    }
+                });
+            });
+        }
+
+        if(!frm.is_new() && (frm.doc.list_type === 'Dynamic Segment' || (frm.doc.recipients || []).length)) {
+            frm.add_custom_button(__('Check WhatsApp Numbers'), function() {
+                frappe.call({
+                    method: 'frappe_whatsapp_waha.utils.bulk_messaging.check_whatsapp_numbers',
+                    args: {
+                        list_name: frm.doc.name
+                    },
+                    callback: function() {
+                        frappe.show_alert({
+                            message: __('Checking numbers in the background'),
+                            indicator: 'blue'
+                        });
+                    }
+                });
+            });
+        }
+
+        // Dynamic segments have no recipient rows to edit
+        if(frm.doc.list_type === 'Dynamic Segment') return;
+
+        if(!frm.is_new()) {
+            frm.add_custom_button(__('Upload Recipients'), function() {
+                upload_recipients(frm);
+            });
+        }
+
         // Add a button to add a test recipient
         frm.add_custom_button(__('Add Test Recipient'), function() {
             let d = new frappe.ui.Dialog({
@@ -125,3 +188,61 @@ frappe.ui.form.on('WhatsApp Recipient List', {
         });
     }
 });
+
+function upload_recipients(frm) {
+    let d = new frappe.ui.Dialog({
+        title: __('Upload Recipients'),
+        fields: [
+            {
+                label: __('CSV or XLSX File'), fieldname: 'file_url', fieldtype: 'Attach', reqd: 1,
+                onchange: function() {
+                    let file_url = d.get_value('file_url');
+                    if(!file_url) return;
+                    frappe.call({
+                        method: 'frappe_whatsapp_waha.utils.bulk_messaging.get_upload_columns',
+                        args: {file_url: file_url},
+                        callback: function(r) {
+                            let columns = r.message || [];
+                            d.set_df_property('mobile_column', 'options', columns);
+                            d.set_df_property('name_column', 'options', [''].concat(columns));
+                            d.set_df_property('data_columns', 'options', columns.map(function(column) {
+                                return {label: column, value: column};
+                            }));
+                        }
+                    });
+                }
+            },
+            {label: __('Mobile Number Column'), fieldname: 'mobile_column', fieldtype: 'Select', reqd: 1},
+            {label: __('Name Column'), fieldname: 'name_column', fieldtype: 'Select'},
+            {
+                label: __('Data Columns'), fieldname: 'data_columns', fieldtype: 'MultiCheck', columns: 3,
+                description: __('Stored as recipient data for template variables; all other columns if none are selected'),
+                options: []
+            },
+            {label: __('Append to Existing Recipients'), fieldname: 'append', fieldtype: 'Check'}
+        ],
+        primary_action_label: __('Upload'),
+        primary_action: function(values) {
+            frappe.call({
+                method: 'frappe_whatsapp_waha.utils.bulk_messaging.upload_recipients',
+                args: {
+                    list_name: frm.doc.name,
+                    file_url: values.file_url,
+                    mobile_column: values.mobile_column,
+                    name_column: values.name_column,
+                    data_columns: values.data_columns && values.data_columns.length ? values.data_columns : null,
+                    append: values.append
+                },
+                callback: function(r) {
+                    d.hide();
+                    frappe.show_alert({
+                        message: __('Importing {0} rows in the background', [r.message || 0]),
+                        indicator: 'blue'
+                    });
+                    frm.reload_doc();
+                }
+            });
+        }
+    });
+    d.show();
+}
@@ -3,10 +3,31 @@ import json
 from frappe import _
 from frappe.model.document import Document
 
+from frappe_whatsapp_waha.utils.phone import deduplicate, get_default_country_code
+from frappe_whatsapp_waha.utils.recipient_import import DYNAMIC_SEGMENT, build_recipient
+
 
 class WhatsAppRecipientList(Document):
 	def validate(self):
-		self.validate_recipients()
+		if self.list_type == DYNAMIC_SEGMENT:
+			self.validate_segment()
+		else:
+			self.validate_recipients()
+	
+	def validate_segment(self):
+		"""A dynamic segment only keeps its query; recipients are read when a campaign is sent"""
+		if not self.doctype_to_import or not self.mobile_field:
+			frappe.throw(_("Select the DocType and the Mobile Number Field of the segment"))
+
+		for fieldname in ("import_filters", "data_fields"):
+			if self.get(fieldname):
+				try:
+					json.loads(self.get(fieldname))
+				except ValueError:
+					frappe.throw(_("{0} must be valid JSON").format(self.meta.get_label(fieldname)))
+
+		self.recipients = []
+		self.sync_nightly = 0
 	
 	def validate_recipients(self):
 		if not self.is_new():
@@ -14,7 +35,11 @@ class WhatsAppRecipientList(Document):
 				frappe.throw(_("At least one recipient is required"))
 	
 	def import_list_from_doctype(self, doctype, mobile_field, name_field=None, filters=None, limit=None, data_fields=None):
-		"""Import recipients from another DocType"""
+		"""Import recipients from another DocType
+
+		Loads every record in memory; large lists are imported in the
+		background by ``utils.recipient_import.import_from_doctype``.
+		"""
 		self.doctype_to_import = doctype
 		self.mobile_field = mobile_field
 		self.filters = filters
@@ -43,37 +68,11 @@ class WhatsAppRecipientList(Document):
 		
 		# Clear existing recipients
 		self.recipients = []
-		
-		# Add recipients
-		for record in records:
-			if not record.get(mobile_field):
-				continue
-				
-			# Format mobile number
-			mobile = record.get(mobile_field)
-			# Remove any non-numeric characters except '+'
-			mobile = ''.join(char for char in mobile if char.isdigit() or char == '+')
-			
-			if not mobile:
-				continue
-
-			recipient_data = {}
-			if data_fields:
-				for field in data_fields:
-					if record.get(field):
-						# Use field name as the variable name in recipient data
-						variable_name = field.lower().replace(" ", "_")
-						recipient_data[variable_name] = record.get(field)
 
-				
-			recipient = {
-				"mobile_number": mobile,
-				"recipient_data": json.dumps(recipient_data)
-			}
-			
-			if name_field and record.get(name_field):
-				recipient["recipient_name"] = record.get(name_field)
-				
+		# Add recipients, each number once
+		country_code = get_default_country_code()
+		recipients = (build_recipient(record, mobile_field, name_field, data_fields, country_code) for record in records)
+		for recipient in deduplicate(filter(None, recipients)):
 			self.append("recipients", recipient)
-		
-		return len(self.recipients)
\ No newline at end of file
+
+		return len(self.recipients)
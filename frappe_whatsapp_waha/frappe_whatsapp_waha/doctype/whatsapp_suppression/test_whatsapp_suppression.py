@@ -0,0 +1,40 @@
+# Copyright (c) 2026, djs4000 and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from frappe_whatsapp_waha.utils import suppression
+from frappe_whatsapp_waha.utils.suppression import add_suppression, is_suppressed
+
+
+class TestWhatsAppSuppression(FrappeTestCase):
+	def setUp(self):
+		# load the numbers of this transaction rather than a set cached earlier
+		suppression._suppressed.pop(frappe.local.site, None)
+
+	def tearDown(self):
+		suppression._suppressed.pop(frappe.local.site, None)
+
+	def test_named_after_normalised_number(self):
+		doc = frappe.get_doc({"doctype": "WhatsApp Suppression", "mobile_number": "+1 (555) 010-0123"}).insert()
+		self.assertEqual(doc.name, "15550100123")
+		self.assertEqual(doc.mobile_number, "15550100123")
+
+	def test_invalid_number_is_rejected(self):
+		with self.assertRaises(frappe.ValidationError):
+			frappe.get_doc({"doctype": "WhatsApp Suppression", "mobile_number": "call me"}).insert()
+
+	def test_add_suppression(self):
+		self.assertTrue(add_suppression("+1 555 010 0124", "Opted Out"))
+		self.assertFalse(add_suppression("0015550100124"))
+		self.assertFalse(add_suppression("not a number"))
+		self.assertEqual(frappe.db.get_value("WhatsApp Suppression", "15550100124", "reason"), "Opted Out")
+
+	def test_is_suppressed_in_any_spelling(self):
+		add_suppression("+1 555 010 0125")
+		self.assertTrue(is_suppressed("+15550100125"))
+		self.assertTrue(is_suppressed("0015550100125"))
+		self.assertTrue(is_suppressed("15550100125@c.us"))
+		self.assertFalse(is_suppressed("+15550100126"))
+		self.assertFalse(is_suppressed(None))
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, djs4000 and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('WhatsApp Suppression', {
+	// refresh: function(frm) {
+
+	// }
+});
@@ -0,0 +1,31 @@
+# Copyright (c) 2026, djs4000 and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+from frappe_whatsapp_waha.utils.phone import normalise
+from frappe_whatsapp_waha.utils.suppression import publish_change
+
+
+class WhatsAppSuppression(Document):
+	def autoname(self):
+		# named after the number, so a lookup is a primary key read
+		self.normalise_number()
+		self.name = self.mobile_number
+
+	def validate(self):
+		self.normalise_number()
+
+	def normalise_number(self):
+		number = normalise(self.mobile_number)
+		if not number:
+			frappe.throw(_("{0} is not a valid mobile number").format(self.mobile_number))
+		self.mobile_number = number
+
+	def on_update(self):
+		publish_change()
+
+	def on_trash(self):
+		publish_change()
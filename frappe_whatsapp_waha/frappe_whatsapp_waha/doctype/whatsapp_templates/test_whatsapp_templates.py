@@ -4,6 +4,22 @@
 # import frappe
 from frappe.tests import UnitTestCase
 
+from frappe_whatsapp_waha.utils.template_cache import compile_text
+
 
 class TestWhatsAppTemplates(UnitTestCase):
-	pass
+	def test_render_substitutes_parameters(self):
+		text = compile_text("Hi {{1}}, order {{2}} ships soon, {{1}}")
+		self.assertEqual(text.render(["Ann", "#5"]), "Hi Ann, order #5 ships soon, Ann")
+
+	def test_render_keeps_placeholders_without_parameter(self):
+		text = compile_text("Hi {{1}}, order {{2}}")
+		self.assertEqual(text.render(["Ann"]), "Hi Ann, order {{2}}")
+		self.assertEqual(compile_text("{{0}} left").render(["x"]), "{{0}} left")
+
+	def test_render_without_placeholders(self):
+		self.assertEqual(compile_text("Plain text").render(["unused"]), "Plain text")
+		self.assertEqual(compile_text(None).render([]), "")
+
+	def test_render_empty_value(self):
+		self.assertEqual(compile_text("Dear {{1}}!").render([None]), "Dear !")
@@ -7,6 +7,8 @@ import json
 import frappe
 from frappe.model.document import Document
 
+from frappe_whatsapp_waha.utils.template_cache import invalidate_template
+
 
 class WhatsAppTemplates(Document):
     """Store template metadata that will be rendered locally before sending."""
@@ -30,13 +32,19 @@ class WhatsAppTemplates(Document):
             self.actual_name = self.template_name.lower().replace(" ", "_")
             self.db_set("actual_name", self.actual_name)
 
+    def on_update(self):
+        invalidate_template(self.name, self.modified)
+
+    def after_rename(self, old_name, new_name, merge=False):
+        invalidate_template(old_name)
+
     def update_template(self):
         # Templates are rendered locally; there is nothing to sync with WAHA.
         return
 
     def on_trash(self):
         # Nothing to clean up remotely.
-        return
+        invalidate_template(self.name)
 
 
 @frappe.whitelist()
@@ -16,7 +16,20 @@ frappe.query_reports["Bulk WhatsApp Status"] = {
             "fieldname": "status",
             "label": __("Status"),
             "fieldtype": "Select",
-            "options": "\nDraft\nQueued\nIn Progress\nCompleted\nPartially Failed"
+            "options": "\nScheduled\nQueued\nIn Progress\nPaused\nCompleted\nPartially Failed\nFailed"
+        },
+        {
+            "fieldname": "page_length",
+            "label": __("Campaigns per Page"),
+            "fieldtype": "Select",
+            "options": "100\n500\n1000",
+            "default": "500"
+        },
+        {
+            "fieldname": "page",
+            "label": __("Page"),
+            "fieldtype": "Int",
+            "default": 1
         },
         // {
         //     "fieldname": "from_number",
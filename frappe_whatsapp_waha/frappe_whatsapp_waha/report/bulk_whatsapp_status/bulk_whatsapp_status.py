@@ -1,4 +1,7 @@
 import frappe
+from frappe.utils import add_days, add_months, cint, getdate, nowdate
+
+DEFAULT_PAGE_LENGTH = 500
 
 
 def execute(filters=None):
@@ -77,57 +80,46 @@ def get_columns():
     ]
 
 def get_data(filters):
+    """Campaigns of the selected page with their message counts
+
+    The counts are the counters kept on each campaign as its messages
+    change, so a page of campaigns is one indexed read whatever the number
+    of messages behind it. Without a date range the last month is shown.
+    """
+    to_date = getdate(filters.get("to_date") or nowdate())
+    from_date = getdate(filters.get("from_date") or add_months(to_date, -1))
+    page_length = cint(filters.get("page_length")) or DEFAULT_PAGE_LENGTH
+
+    values = {
+        "from_date": from_date,
+        # creation is a datetime, so the end date is compared exclusively
+        "to_date": add_days(to_date, 1),
+        "status": filters.get("status"),
+        "limit": page_length,
+        "offset": (max(cint(filters.get("page")), 1) - 1) * page_length,
+    }
+
     conditions = ""
-    if filters.get("from_date") and filters.get("to_date"):
-        conditions += " AND creation BETWEEN %(from_date)s AND %(to_date)s"
-    
     if filters.get("status"):
         conditions += " AND status = %(status)s"
-        
-    if filters.get("from_number"):
-        conditions += " AND from_number = %(from_number)s"
-    
-    data = frappe.db.sql("""
-        SELECT 
-            name, 
-            title, 
-            creation, 
-            recipient_count, 
-            sent_count, 
-            status 
-        FROM 
-            `tabBulk WhatsApp Message` 
-        WHERE 
-            docstatus = 1 
-            {conditions}
-        ORDER BY 
-            creation DESC
-    """.format(conditions=conditions), filters, as_dict=1)
-    
-    # Fetch additional stats for each bulk message
-    for row in data:
-        # Get delivered count
-        row["delivered_count"] = frappe.db.count("WhatsApp Message", {
-            "bulk_message_reference": row.name,
-            "status": "delivered"
-        })
-        
-        # Get read count
-        row["read_count"] = frappe.db.count("WhatsApp Message", {
-            "bulk_message_reference": row.name,
-            "status": "read"
-        })
 
-         # Get read count
-        row["sent_count"] = frappe.db.count("WhatsApp Message", {
-            "bulk_message_reference": row.name,
-            "status": "sent"
-        })
-        
-        # Get failed count
-        row["failed_count"] = frappe.db.count("WhatsApp Message", {
-            "bulk_message_reference": row.name,
-            "status": "failed"
-        })
-    
-    return data
+    return frappe.db.sql("""
+        SELECT
+            name,
+            title,
+            creation,
+            recipient_count,
+            sent_count,
+            delivered_count,
+            read_count,
+            failed_count,
+            status
+        FROM `tabBulk WhatsApp Message`
+        WHERE
+            docstatus = 1
+            AND creation >= %(from_date)s
+            AND creation < %(to_date)s
+            {conditions}
+        ORDER BY creation DESC
+        LIMIT %(limit)s OFFSET %(offset)s
+    """.format(conditions=conditions), values, as_dict=1)
@@ -0,0 +1,29 @@
+frappe.query_reports["WhatsApp Delivery Latency"] = {
+    "filters": [
+        {
+            "fieldname": "from_date",
+            "label": __("From Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.add_days(frappe.datetime.get_today(), -7)
+        },
+        {
+            "fieldname": "to_date",
+            "label": __("To Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.get_today()
+        },
+        {
+            "fieldname": "group_by",
+            "label": __("Group By"),
+            "fieldtype": "Select",
+            "options": "Campaign\nSession\nHour",
+            "default": "Campaign"
+        },
+        {
+            "fieldname": "campaign",
+            "label": __("Campaign"),
+            "fieldtype": "Link",
+            "options": "Bulk WhatsApp Message"
+        }
+    ]
+};
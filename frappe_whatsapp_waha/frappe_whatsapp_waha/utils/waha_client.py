@@ -10,6 +10,8 @@ import requests
 
 import frappe
 
+from frappe_whatsapp_waha.utils.number_check import resolve_chat_id
+
 
 class WahaAPIError(Exception):
     """Exception raised when a WAHA API request fails."""
@@ -68,10 +70,12 @@ class WahaResponse:
 class WahaClient:
     """HTTP client used to talk to the configured WAHA instance."""
 
-    def __init__(self, *, base_url: str, session: str | None, token: str) -> None:
+    def __init__(self, *, base_url: str, session: str | None, token: str, timeout: float = 30) -> None:
         self._base_url = base_url.rstrip("/")
         self._session = (session or "").strip() or None
         self._token = token
+        # read once, so a client can be shared by threads without a site context
+        self._timeout = timeout
 
     @classmethod
     def from_settings(cls) -> "WahaClient":
@@ -85,7 +89,12 @@ class WahaClient:
         if not settings.url:
             frappe.throw("WAHA Host URL is missing from WhatsApp Settings")
 
-        return cls(base_url=settings.url, session=settings.session, token=token)
+        return cls(
+            base_url=settings.url,
+            session=settings.session,
+            token=token,
+            timeout=frappe.conf.get("waha_timeout", 30),
+        )
 
     # ---- request helpers -------------------------------------------------
 
@@ -104,7 +113,7 @@ class WahaClient:
                 url,
                 headers=self._headers(json_body=json_payload is not None),
                 json=json_payload,
-                timeout=frappe.conf.get("waha_timeout", 30),
+                timeout=self._timeout,
             )
         except requests.RequestException as exc:
             raise WahaAPIError(
@@ -178,9 +187,25 @@ class WahaClient:
             payload["session"] = self._session
         return self._request("POST", "api/sendReaction", json_payload=payload)
 
+    def get_chat_messages(self, phone: str, *, limit: int = 20) -> list[dict[str, Any]]:
+        """Return the latest messages of the chat with ``phone``, newest first."""
+
+        session = self._session or "default"
+        path = f"api/{session}/chats/{self._as_chat_id(phone)}/messages?limit={int(limit)}&downloadMedia=false"
+        data = self._request("GET", path).data
+        return data if isinstance(data, list) else []
+
+    def check_exists(self, phone: str) -> dict[str, Any]:
+        """Ask WAHA whether ``phone`` is on WhatsApp.
+
+        Returns ``{"numberExists": bool, "chatId": str | None}``.
+        """
+
+        session = self._session or "default"
+        path = f"api/contacts/check-exists?phone={phone}&session={session}"
+        data = self._request("GET", path).data
+        return data if isinstance(data, dict) else {}
+
     def _as_chat_id(self, phone: str) -> str:
-        phone = (phone or "").strip()
-        if phone.endswith("@c.us"):
-            return phone
-        return f"{phone}@c.us"
+        return resolve_chat_id(phone)
 
@@ -117,13 +117,21 @@ override_doctype_class = {
 
 scheduler_events = {
     "all": [
-        "frappe_whatsapp_waha.utils.trigger_whatsapp_notifications_all"
+        "frappe_whatsapp_waha.utils.trigger_whatsapp_notifications_all",
+        "frappe_whatsapp_waha.utils.outbox.schedule_dispatch",
+        "frappe_whatsapp_waha.utils.bulk_messaging.schedule_bulk_messages",
     ],
+    "cron": {
+        "* * * * *": [
+            "frappe_whatsapp_waha.utils.campaign_scheduler.release_due_campaigns",
+        ],
+    },
     "hourly": [
         "frappe_whatsapp_waha.utils.trigger_whatsapp_notifications_hourly"
     ],
     "hourly_long": [
-        "frappe_whatsapp_waha.utils.trigger_whatsapp_notifications_hourly_long"
+        "frappe_whatsapp_waha.utils.trigger_whatsapp_notifications_hourly_long",
+        "frappe_whatsapp_waha.utils.campaign_counters.reconcile_campaigns",
     ],
     "daily": [
         "frappe_whatsapp_waha.utils.trigger_whatsapp_notifications_daily",
@@ -131,6 +139,7 @@ scheduler_events = {
     ],
     "daily_long": [
         "frappe_whatsapp_waha.utils.trigger_whatsapp_notifications_daily_long",
+        "frappe_whatsapp_waha.utils.recipient_import.sync_nightly_lists",
     ],
     "weekly": [
         "frappe_whatsapp_waha.utils.trigger_whatsapp_notifications_weekly",
@@ -146,6 +155,12 @@ scheduler_events = {
     ],
 }
 
+# Jobs and Requests
+# -----------------
+
+after_job = ["frappe_whatsapp_waha.utils.notification_log.flush_notification_logs"]
+after_request = ["frappe_whatsapp_waha.utils.notification_log.flush_notification_logs"]
+
 # Testing
 # -------
 
@@ -0,0 +1,23 @@
+"""Mark campaigns submitted before recipients were released in chunks as released."""
+
+from __future__ import annotations
+
+import frappe
+
+
+def execute() -> None:
+    """Older campaigns inserted every message on submit.
+
+    Left unreleased, resuming one or the campaign scheduler would release
+    its recipients from the start again and send every message twice.
+    """
+
+    frappe.db.sql(
+        """
+        UPDATE `tabBulk WhatsApp Message`
+        SET release_finished = 1,
+            released_count = recipient_count
+        WHERE docstatus = 1
+            AND release_finished = 0
+        """
+    )
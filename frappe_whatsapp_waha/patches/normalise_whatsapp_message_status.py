@@ -0,0 +1,22 @@
+"""Rewrite the statuses of existing messages to the fixed set of statuses."""
+
+from __future__ import annotations
+
+import frappe
+
+from frappe_whatsapp_waha.utils.message_status import normalise_status
+
+
+def execute() -> None:
+    """Status used to be free text, so rows may hold any casing or WAHA's own names."""
+
+    # the column compares case-insensitively, so spellings are told apart in binary
+    for (status,) in frappe.db.sql(
+        "SELECT status FROM `tabWhatsApp Message` WHERE IFNULL(status, '') != '' GROUP BY BINARY status"
+    ):
+        normalised = normalise_status(status)
+        if normalised and normalised != status:
+            frappe.db.sql(
+                "UPDATE `tabWhatsApp Message` SET status = %s WHERE BINARY status = %s",
+                (normalised, status),
+            )
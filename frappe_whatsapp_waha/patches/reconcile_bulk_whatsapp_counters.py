@@ -0,0 +1,11 @@
+"""Recount the counters of existing campaigns from their messages."""
+
+from __future__ import annotations
+
+from frappe_whatsapp_waha.utils.campaign_counters import reconcile_campaigns
+
+
+def execute() -> None:
+    """Counters of campaigns sent before they were kept may not match their messages."""
+
+    reconcile_campaigns(all_campaigns=True)
@@ -0,0 +1,14 @@
+"""Turn on opt-out handling for sites installed before it existed."""
+
+from __future__ import annotations
+
+import frappe
+
+
+def execute() -> None:
+    """Field defaults only apply to new documents, not to the existing settings."""
+
+    frappe.db.set_single_value(
+        "WhatsApp Settings",
+        {"auto_suppress_opt_outs": 1, "opt_out_keywords": "STOP\nUNSUBSCRIBE"},
+    )
@@ -0,0 +1,44 @@
+"""Assign a priority lane to messages already waiting in the outbox."""
+
+from __future__ import annotations
+
+import frappe
+from frappe.utils import add_days, cint, now_datetime
+
+
+def execute() -> None:
+    """Queued messages without a lane would never be claimed by the dispatcher.
+
+    Only messages queued within the last ``whatsapp_outbox_max_age_days``
+    days get a lane. Older ones are marked Failed instead of reaching their
+    recipients weeks or months late.
+    """
+
+    current = now_datetime()
+    values = {
+        "cutoff": add_days(current, -cint(frappe.conf.get("whatsapp_outbox_max_age_days", 2))),
+        "now": current,
+    }
+
+    frappe.db.sql(
+        """
+        UPDATE `tabWhatsApp Message`
+        SET status = 'Failed',
+            failed_at = %(now)s
+        WHERE type = 'Outgoing'
+            AND status = 'Queued'
+            AND IFNULL(priority_lane, '') = ''
+            AND creation < %(cutoff)s
+        """,
+        values,
+    )
+
+    frappe.db.sql(
+        """
+        UPDATE `tabWhatsApp Message`
+        SET priority_lane = IF(IFNULL(bulk_message_reference, '') = '', 'Manual', 'Campaign')
+        WHERE type = 'Outgoing'
+            AND status = 'Queued'
+            AND IFNULL(priority_lane, '') = ''
+        """
+    )
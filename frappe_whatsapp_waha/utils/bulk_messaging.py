@@ -1,64 +1,167 @@
 import json
 import frappe
+from frappe import _
 from frappe.utils import cint
 
+from frappe_whatsapp_waha.utils import campaign_counters
+from frappe_whatsapp_waha.utils.number_check import CHECK_METHOD
+from frappe_whatsapp_waha.utils.recipient_import import (
+    SYNC_METHOD,
+    UPLOAD_METHOD,
+    count_rows,
+    enqueue_import,
+    get_upload_path,
+    read_header,
+)
+
+SWEEP_KEY = "whatsapp_campaign_sweep"
+
 
 @frappe.whitelist()
 def get_progress(name):
     """Get progress for a bulk message"""
-    doc = frappe.get_doc("Bulk WhatsApp Message", name)
-    return doc.get_progress()
+    # Served from the campaign counters; the document and its recipients
+    # table are not loaded.
+    frappe.has_permission("Bulk WhatsApp Message", "read", name, throw=True)
+    return campaign_counters.get_progress(name)
 
 @frappe.whitelist()
 def retry_failed(name):
     """Retry failed messages"""
     doc = frappe.get_doc("Bulk WhatsApp Message", name)
-    doc.retry_failed()
+    doc.check_permission("write")
+    return doc.retry_failed()
+
+@frappe.whitelist()
+def pause_campaign(name):
+    """Pause a scheduled or running bulk message"""
+    doc = frappe.get_doc("Bulk WhatsApp Message", name)
+    doc.check_permission("write")
+    doc.pause()
+    return True
+
+@frappe.whitelist()
+def resume_campaign(name):
+    """Resume a paused or interrupted bulk message"""
+    doc = frappe.get_doc("Bulk WhatsApp Message", name)
+    doc.check_permission("write")
+    doc.resume()
     return True
 
 @frappe.whitelist()
 def import_recipients(list_name, doctype, mobile_field, name_field=None, filters=None, limit=None, data_fields=None):
-    """Import recipients from a DocType"""
+    """Import recipients from a DocType in the background"""
     if filters and isinstance(filters, str):
         filters = json.loads(filters)
 
     if data_fields and isinstance(data_fields, str):
         data_fields = json.loads(data_fields)
-        
-    doc = frappe.get_doc("WhatsApp Recipient List", list_name)
-    count = doc.import_list_from_doctype(doctype, mobile_field, name_field, filters, limit, data_fields)
-    doc.save()
-    
-    return count
+
+    frappe.has_permission("WhatsApp Recipient List", "write", list_name, throw=True)
+    frappe.has_permission(doctype, "read", throw=True)
+
+    frappe.db.set_value("WhatsApp Recipient List", list_name, {
+        "doctype_to_import": doctype,
+        "mobile_field": mobile_field,
+        "name_field": name_field,
+        "import_filters": json.dumps(filters) if filters else None,
+        "data_fields": json.dumps(data_fields) if data_fields else None,
+        "import_limit": cint(limit) or None,
+    })
+    enqueue_import(
+        list_name,
+        doctype=doctype,
+        mobile_field=mobile_field,
+        name_field=name_field,
+        filters=filters,
+        limit=cint(limit) or None,
+        data_fields=data_fields,
+    )
+
+    return frappe.db.count(doctype, filters=filters)
+
+@frappe.whitelist()
+def get_upload_columns(file_url):
+    """Column names of an uploaded CSV or XLSX file"""
+    frappe.get_doc("File", {"file_url": file_url}).check_permission("read")
+    return read_header(get_upload_path(file_url))
+
+@frappe.whitelist()
+def upload_recipients(list_name, file_url, mobile_column, name_column=None, data_columns=None, append=0):
+    """Import recipients from an uploaded CSV or XLSX file in the background"""
+    if data_columns and isinstance(data_columns, str):
+        data_columns = json.loads(data_columns)
+
+    frappe.has_permission("WhatsApp Recipient List", "write", list_name, throw=True)
+    frappe.get_doc("File", {"file_url": file_url}).check_permission("read")
+
+    path = get_upload_path(file_url)
+    header = read_header(path)
+    missing = [column for column in (mobile_column, name_column, *(data_columns or ())) if column and column not in header]
+    if missing:
+        frappe.throw(_("Columns not found in the file: {0}").format(", ".join(missing)))
+
+    # the uploaded rows would be overwritten by the next DocType sync
+    frappe.db.set_value("WhatsApp Recipient List", list_name, {"import_from_doctype": 0, "sync_nightly": 0})
+    enqueue_import(
+        list_name,
+        UPLOAD_METHOD,
+        file_url=file_url,
+        mobile_column=mobile_column,
+        name_column=name_column or None,
+        data_columns=data_columns or None,
+        append=cint(append),
+    )
+
+    return count_rows(path)
+
+@frappe.whitelist()
+def check_whatsapp_numbers(list_name):
+    """Check in the background which numbers of a recipient list are on WhatsApp"""
+    frappe.has_permission("WhatsApp Recipient List", "write", list_name, throw=True)
+    frappe.enqueue(
+        CHECK_METHOD,
+        queue="long",
+        timeout=6 * 3600,
+        job_id=f"whatsapp_number_check:{list_name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        list_name=list_name,
+    )
+    return True
+
+@frappe.whitelist()
+def sync_recipients(list_name):
+    """Apply the source changes since the last import to a recipient list"""
+    frappe.has_permission("WhatsApp Recipient List", "write", list_name, throw=True)
+    enqueue_import(list_name, SYNC_METHOD)
+    return True
 
 @frappe.whitelist()
 def schedule_bulk_messages():
-    """Background job to process bulk WhatsApp messages"""
-    # Find queued bulk messages with recipient counts less than sent counts
-    bulk_messages = frappe.get_all(
-        "Bulk WhatsApp Message", 
-        filters={
-            "status": "Queued",
-            "docstatus": 1
-        },
-        fields=["name", "recipient_count", "sent_count"]
+    """Background job to process bulk WhatsApp messages
+
+    Completes running campaigns whose counters drifted and so missed their
+    completion. Runs from the scheduler at most every
+    ``whatsapp_campaign_sweep_interval`` seconds and reads the campaign
+    counters only; a fully released campaign that looks finished is
+    reconciled with its messages, which completes it if it is.
+    """
+    cache = frappe.cache()
+    interval = max(cint(frappe.conf.get("whatsapp_campaign_sweep_interval", 300)), 1)
+    if not cache.set(cache.make_key(SWEEP_KEY), 1, ex=interval, nx=True):
+        return
+
+    candidates = frappe.db.sql_list(
+        """
+        SELECT name
+        FROM `tabBulk WhatsApp Message`
+        WHERE docstatus = 1
+            AND status IN ('Queued', 'In Progress')
+            AND release_finished = 1
+            AND (queued_count = 0 OR sent_count + failed_count >= recipient_count)
+        """
     )
-    
-    for bulk in bulk_messages:
-        # Skip if all messages have been sent
-        if cint(bulk.sent_count) >= cint(bulk.recipient_count):
-            frappe.db.set_value("Bulk WhatsApp Message", bulk.name, "status", "Completed")
-            continue
-            
-        # Check for failed messages
-        failed_count = frappe.db.count("WhatsApp Message", {
-            "bulk_message_reference": bulk.name,
-            "status": "Failed"
-        })
-        
-        # If all messages are either sent or failed
-        if cint(bulk.sent_count) - failed_count + cint(failed_count) >= cint(bulk.recipient_count):
-            if failed_count > 0:
-                frappe.db.set_value("Bulk WhatsApp Message", bulk.name, "status", "Partially Failed")
-            else:
-                frappe.db.set_value("Bulk WhatsApp Message", bulk.name, "status", "Completed")
+
+    for name in candidates:
+        campaign_counters.reconcile(name)
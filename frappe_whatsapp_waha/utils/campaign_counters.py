@@ -0,0 +1,314 @@
+"""Atomic, batched counters for Bulk WhatsApp Message campaigns.
+
+Counter changes are collected in memory and applied with one
+``col = col + k`` UPDATE per campaign right before the transaction that
+caused them commits. The counters therefore always match the committed
+message rows, and a rolled back transaction leaves them untouched.
+
+Writes that bypass the document, such as a manual SQL fix, can still
+make them drift; ``reconcile`` recounts a campaign from its messages and
+an hourly job does so for recent campaigns.
+"""
+
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from typing import Any
+
+import frappe
+from frappe.utils import add_days, cint, flt, nowdate
+
+from frappe_whatsapp_waha.utils.message_status import normalise_status
+
+COUNTERS = ("queued_count", "sent_count", "delivered_count", "read_count", "failed_count")
+
+# how far a message got; each counter counts the messages that reached its rank
+PROGRESS_COUNTERS = ((1, "sent_count"), (2, "delivered_count"), (3, "read_count"))
+
+_STATUS_BUCKETS = {
+    "Queued": "queued",
+    "Sending": "queued",
+    "Sent": "sent",
+    "Delivered": "delivered",
+    "Read": "read",
+    "Failed": "failed",
+    # never sent, so the message is settled like a failure
+    "Suppressed": "failed",
+}
+_BUCKET_RANK = {"sent": 1, "delivered": 2, "read": 3}
+
+PROGRESS_EVENT = "whatsapp_campaign_progress"
+PROGRESS_CACHE_KEY = "whatsapp_campaign_progress"
+PUSH_THROTTLE_KEY = "whatsapp_campaign_progress_pushed"
+
+# campaigns created this many days ago or later are reconciled every hour
+RECONCILE_DAYS = 7
+
+# site -> campaign -> counter deltas of the open transaction
+_pending: dict[str, defaultdict[str, Counter]] = {}
+
+
+def status_bucket(status: str | None) -> str | None:
+    """Map a WhatsApp Message status, in any spelling, to queued/sent/delivered/read/failed."""
+
+    return _STATUS_BUCKETS.get(normalise_status(status))
+
+
+def bucket_statuses(*buckets: str) -> tuple[str, ...]:
+    """Return the message statuses falling into any of ``buckets``."""
+
+    return tuple(status for status, bucket in _STATUS_BUCKETS.items() if bucket in buckets)
+
+
+def record_transition(campaign: str | None, old_status: str | None, new_status: str | None) -> None:
+    """Count a message of ``campaign`` moving from ``old_status`` to ``new_status``."""
+
+    if not campaign:
+        return
+
+    old_bucket, new_bucket = status_bucket(old_status), status_bucket(new_status)
+    if old_bucket == new_bucket:
+        return
+
+    deltas: Counter = Counter()
+    for bucket, sign in ((old_bucket, -1), (new_bucket, 1)):
+        if bucket == "queued":
+            deltas["queued_count"] += sign
+        elif bucket == "failed":
+            deltas["failed_count"] += sign
+
+    old_rank = _BUCKET_RANK.get(old_bucket, 0)
+    new_rank = _BUCKET_RANK.get(new_bucket, 0)
+    for rank, counter in PROGRESS_COUNTERS:
+        if old_rank < rank <= new_rank:
+            deltas[counter] += 1
+
+    add(campaign, **deltas)
+
+
+def add(campaign: str, **deltas: int) -> None:
+    """Add ``deltas`` to the counters of ``campaign`` when the transaction commits."""
+
+    if not campaign or not any(deltas.values()):
+        return
+
+    site_pending = _pending.get(frappe.local.site)
+    if site_pending is None:
+        site_pending = _pending[frappe.local.site] = defaultdict(Counter)
+        frappe.db.before_commit.add(flush)
+        frappe.db.after_rollback.add(discard)
+
+    site_pending[campaign].update(deltas)
+
+
+def flush() -> None:
+    """Apply the collected deltas, one UPDATE per campaign.
+
+    The increments lock the campaign row until the transaction commits, so
+    concurrent workers cannot lose counts, and the completion check that
+    follows sees every message counted before it.
+    """
+
+    site_pending = _pending.pop(frappe.local.site, None)
+    if not site_pending:
+        return
+
+    for campaign in sorted(site_pending):
+        deltas = site_pending[campaign]
+        if not any(deltas.values()):
+            continue
+
+        values = {counter: deltas.get(counter, 0) for counter in COUNTERS}
+        values["name"] = campaign
+        frappe.db.sql(
+            """
+            UPDATE `tabBulk WhatsApp Message`
+            SET
+                queued_count = GREATEST(queued_count + %(queued_count)s, 0),
+                sent_count = sent_count + %(sent_count)s,
+                delivered_count = delivered_count + %(delivered_count)s,
+                read_count = read_count + %(read_count)s,
+                failed_count = GREATEST(failed_count + %(failed_count)s, 0)
+            WHERE name = %(name)s
+            """,
+            values,
+        )
+        if not complete(campaign):
+            _push_progress(campaign)
+
+
+def complete(campaign: str) -> bool:
+    """Mark ``campaign`` finished if it is fully released and all of its messages have settled.
+
+    This is the only place a campaign is completed. Returns True only for
+    the call that made the transition, which also pushes the final progress.
+    """
+
+    frappe.db.sql(
+        """
+        UPDATE `tabBulk WhatsApp Message`
+        SET status = IF(failed_count > 0, 'Partially Failed', 'Completed')
+        WHERE name = %(name)s
+            AND status IN ('Queued', 'In Progress', 'Paused')
+            AND release_finished = 1
+            AND queued_count = 0
+            AND sent_count + failed_count >= recipient_count
+        """,
+        {"name": campaign},
+    )
+    if frappe.db.sql("SELECT ROW_COUNT()")[0][0] <= 0:
+        return False
+
+    _push_progress(campaign, final=True)
+    return True
+
+
+def discard() -> None:
+    _pending.pop(frappe.local.site, None)
+
+
+def reconcile(campaign: str) -> None:
+    """Recount the counters of ``campaign`` from its messages and commit them.
+
+    A campaign the recount shows to be finished is completed.
+
+    The campaign row is locked before the messages are counted, in a new
+    transaction. A concurrent transaction changing messages of the campaign
+    flushes its deltas after the lock is released, so its changes are
+    neither lost nor counted twice.
+    """
+
+    frappe.db.commit()
+    if not frappe.db.get_value("Bulk WhatsApp Message", campaign, "name", for_update=True):
+        return
+
+    counts = frappe.db.sql(
+        """
+        SELECT
+            COUNT(CASE WHEN status IN %(queued)s THEN 1 END) AS queued_count,
+            COUNT(CASE WHEN status IN %(sent)s THEN 1 END) AS sent_count,
+            COUNT(CASE WHEN status IN %(delivered)s THEN 1 END) AS delivered_count,
+            COUNT(CASE WHEN status IN %(read)s THEN 1 END) AS read_count,
+            COUNT(CASE WHEN status IN %(failed)s THEN 1 END) AS failed_count
+        FROM `tabWhatsApp Message`
+        WHERE bulk_message_reference = %(campaign)s
+        """,
+        {
+            "campaign": campaign,
+            "queued": bucket_statuses("queued"),
+            "sent": bucket_statuses("sent", "delivered", "read"),
+            "delivered": bucket_statuses("delivered", "read"),
+            "read": bucket_statuses("read"),
+            "failed": bucket_statuses("failed"),
+        },
+        as_dict=True,
+    )[0]
+
+    frappe.db.set_value("Bulk WhatsApp Message", campaign, counts, update_modified=False)
+    complete(campaign)
+    frappe.db.commit()
+    frappe.cache().delete_value(f"{PROGRESS_CACHE_KEY}:{campaign}")
+
+
+def reconcile_campaigns(all_campaigns: bool = False) -> None:
+    """Scheduler entry point reconciling running and recent campaigns.
+
+    Campaigns are read in keyset pages and reconciled one transaction each.
+    """
+
+    or_filters = None
+    if not all_campaigns:
+        or_filters = [
+            ["status", "in", ("Queued", "In Progress", "Paused")],
+            ["creation", ">=", add_days(nowdate(), -RECONCILE_DAYS)],
+        ]
+
+    after = None
+    while True:
+        filters = [["docstatus", "=", 1]]
+        if after:
+            filters.append(["name", ">", after])
+        names = frappe.get_all(
+            "Bulk WhatsApp Message",
+            filters=filters,
+            or_filters=or_filters,
+            order_by="name asc",
+            limit=100,
+            pluck="name",
+        )
+        for name in names:
+            reconcile(name)
+
+        if len(names) < 100:
+            break
+        after = names[-1]
+
+
+def get_progress(campaign: str) -> dict[str, Any]:
+    """Return the progress of ``campaign`` from its counters.
+
+    Results are cached for ``whatsapp_progress_cache_ttl`` seconds, so any
+    number of viewers costs at most one primary key read per interval.
+    """
+
+    cache_key = f"{PROGRESS_CACHE_KEY}:{campaign}"
+    progress = frappe.cache().get_value(cache_key)
+    if progress is None:
+        progress = _read_progress(campaign)
+        frappe.cache().set_value(
+            cache_key,
+            progress,
+            expires_in_sec=max(cint(frappe.conf.get("whatsapp_progress_cache_ttl", 2)), 1),
+        )
+    return progress
+
+
+def _read_progress(campaign: str) -> dict[str, Any]:
+    row = frappe.db.get_value(
+        "Bulk WhatsApp Message",
+        campaign,
+        ["status", "recipient_count", *COUNTERS],
+        as_dict=True,
+    ) or frappe._dict()
+
+    total = cint(row.recipient_count)
+    sent = cint(row.sent_count)
+    failed = cint(row.failed_count)
+    return {
+        "name": campaign,
+        "status": row.status,
+        "total": total,
+        "queued": cint(row.queued_count),
+        "sent": sent,
+        "delivered": cint(row.delivered_count),
+        "read": cint(row.read_count),
+        "failed": failed,
+        "processed": sent + failed,
+        "percent": flt(sent / total * 100, 2) if total else 0,
+    }
+
+
+def _push_progress(campaign: str, final: bool = False) -> None:
+    """Send the new progress to open forms, at most once per interval.
+
+    The update that finishes a campaign is always sent, so the form never
+    stays on a stale value; it happens once per campaign.
+    """
+
+    if not final:
+        throttle_key = f"{PUSH_THROTTLE_KEY}:{campaign}"
+        if frappe.cache().get_value(throttle_key):
+            return
+        frappe.cache().set_value(
+            throttle_key,
+            1,
+            expires_in_sec=max(cint(frappe.conf.get("whatsapp_progress_push_interval", 2)), 1),
+        )
+
+    frappe.publish_realtime(
+        PROGRESS_EVENT,
+        _read_progress(campaign),
+        doctype="Bulk WhatsApp Message",
+        docname=campaign,
+        after_commit=True,
+    )
@@ -0,0 +1,208 @@
+"""Pre-rendering of Bulk WhatsApp Message campaigns.
+
+Every recipient's final payload (chat id, text and media link) is
+rendered once, when its message row is written, so that dispatching a
+campaign message is a single WAHA request. The same renderer validates
+the whole recipient list in the first release job, before anything is
+sent.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+from typing import Any, Iterable, Iterator
+
+import frappe
+from frappe import _
+from frappe.utils import get_url
+
+from frappe_whatsapp_waha.utils.phone import as_chat_id, get_default_country_code, normalise
+from frappe_whatsapp_waha.utils.recipients import fetch_recipient_page, get_chunk_size, get_recipient_source
+from frappe_whatsapp_waha.utils.template_cache import CompiledText, get_compiled_template
+
+# errors listed when a campaign fails validation
+MAX_REPORTED_ERRORS = 20
+
+
+class RenderError(frappe.ValidationError):
+    pass
+
+
+@dataclass(slots=True, frozen=True)
+class RenderedMessage:
+    """Everything the dispatcher needs to send one campaign message."""
+
+    chat_id: str
+    text: str
+    media_link: str | None
+    content_type: str
+    body_param: str | None
+    parameters: tuple[Any, ...]
+
+
+class CampaignRenderer:
+    """Render the messages of one campaign.
+
+    The template is compiled and the common variables parsed once; each
+    recipient then costs one JSON parse and one pass over the template.
+    """
+
+    def __init__(self, campaign: Any) -> None:
+        self.campaign = campaign
+        self.template = None
+        self.common_variables: dict[str, Any] | None = None
+
+        if campaign.use_template and campaign.template:
+            self.template = get_compiled_template(campaign.template)
+
+        if campaign.use_template and campaign.variable_type == "Common" and campaign.template_variables:
+            self.common_variables = _parse_variables(campaign.template_variables, _("Template Variables"))
+
+        self.base_url = get_url()
+        self.country_code = get_default_country_code()
+
+    def render(self, recipient: Any) -> RenderedMessage:
+        """Render the message for ``recipient``; raise RenderError if it cannot be sent."""
+
+        chat_id = self._chat_id(recipient.get("mobile_number"))
+
+        recipient_data = recipient.get("recipient_data")
+        variables = _parse_variables(recipient_data, _("Recipient Data")) if recipient_data else {}
+
+        # Bulk WhatsApp Message has no message content field, so a campaign
+        # without a template has no text to render
+        if not self.template:
+            return RenderedMessage(chat_id, "", None, "text", None, ())
+
+        # mirrors what WhatsAppMessage._collect_template_parameters reads back
+        body_param, values = None, {}
+        if recipient_data and self.campaign.variable_type == "Unique":
+            body_param, values = recipient_data, variables
+        elif self.common_variables is not None:
+            body_param, values = self.campaign.template_variables, self.common_variables
+        elif variables and self.template.parameter_fields:
+            values = {str(idx): variables.get(field) for idx, field in enumerate(self.template.parameter_fields, start=1)}
+            body_param = frappe.as_json(values)
+
+        return self._render_template(chat_id, body_param, values)
+
+    def rerender(self, number: str | None, body_param: str | None) -> RenderedMessage:
+        """Render a message written earlier again, with the campaign's current template.
+
+        The message keeps its own parameters, except that common variables
+        are read from the campaign. Raise RenderError if it cannot be sent.
+        """
+
+        chat_id = self._chat_id(number)
+        if not self.template:
+            return RenderedMessage(chat_id, "", None, "text", None, ())
+
+        if self.common_variables is not None:
+            body_param, values = self.campaign.template_variables, self.common_variables
+        else:
+            values = _parse_variables(body_param, _("Body Parameters")) if body_param else {}
+
+        return self._render_template(chat_id, body_param, values)
+
+    def validate(self, recipients: Iterable[Any]) -> None:
+        """Render every recipient and throw one error listing those that fail."""
+
+        errors: list[str] = []
+        failed = 0
+
+        for position, recipient in enumerate(recipients, start=1):
+            try:
+                self.render(recipient)
+            except RenderError as exc:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    number = recipient.get("mobile_number") or _("no number")
+                    errors.append(_("Recipient {0} ({1}): {2}").format(position, number, exc))
+
+        if failed:
+            frappe.clear_messages()
+            frappe.throw(
+                _("{0} recipients cannot be sent to:").format(failed) + "<br>" + "<br>".join(errors),
+                title=_("Invalid Recipients"),
+            )
+
+    def _chat_id(self, number: str | None) -> str:
+        number = (number or "").strip()
+        if not number:
+            raise RenderError(_("Mobile number is missing"))
+        if "@" not in number and not normalise(number, self.country_code):
+            raise RenderError(_("{0} is not a valid mobile number").format(number))
+        return as_chat_id(number, self.country_code)
+
+    def _render_template(self, chat_id: str, body_param: str | None, values: dict[str, Any]) -> RenderedMessage:
+        parameters = tuple(values.values()) if self.template.parameter_fields else ()
+
+        segments: list[str] = []
+        if self.template.header_type == "TEXT" and self.template.header:
+            segments.append(self._render_text(self.template.header, parameters))
+        segments.append(self._render_text(self.template.body, parameters))
+        if self.template.footer:
+            segments.append(self.template.footer)
+
+        media_link = self._media_link()
+        if media_link:
+            content_type = "image" if self.template.header_type == "IMAGE" else "document"
+        else:
+            content_type = "text"
+
+        return RenderedMessage(
+            chat_id=chat_id,
+            text="\n\n".join(filter(None, segments)),
+            media_link=media_link,
+            content_type=content_type,
+            body_param=body_param,
+            parameters=parameters,
+        )
+
+    def _render_text(self, text: CompiledText, parameters: tuple[Any, ...]) -> str:
+        missing = [placeholder for index, placeholder in zip(text.indices, text.placeholders) if index >= len(parameters)]
+        if missing:
+            raise RenderError(_("No value for {0}").format(", ".join(missing)))
+        return text.render(parameters)
+
+    def _media_link(self) -> str | None:
+        attach = self.campaign.attach
+        if self.template.header_type == "IMAGE":
+            return self._absolute(attach or self.template.sample)
+        if self.template.header_type == "DOCUMENT":
+            return self._absolute(attach)
+        return None
+
+    def _absolute(self, link: str | None) -> str | None:
+        if not link:
+            return None
+        if link.startswith("http"):
+            return link
+        return f"{self.base_url}/{link.lstrip('/')}"
+
+
+def iter_recipients(campaign: Any) -> Iterator[Any]:
+    """Stream the recipients of ``campaign`` page by page."""
+
+    parenttype, parent = get_recipient_source(campaign)
+    chunk_size = get_chunk_size()
+    after = None
+    while True:
+        page = fetch_recipient_page(parenttype, parent, after=after, limit=chunk_size)
+        yield from page
+        if len(page) < chunk_size:
+            break
+        after = page[-1].name
+
+
+def _parse_variables(data: str, label: str) -> dict[str, Any]:
+    try:
+        variables = json.loads(data)
+    except ValueError:
+        raise RenderError(_("{0} is not valid JSON").format(label))
+
+    if not isinstance(variables, dict):
+        raise RenderError(_("{0} must be a JSON object").format(label))
+    return variables
+
@@ -0,0 +1,90 @@
+"""Scheduled and drip-rate release of Bulk WhatsApp Message campaigns.
+
+A scheduler tick every minute starts campaigns whose scheduled time has
+come. Paced campaigns, those with a drip rate or a send window, are not
+fanned out at once: each tick releases the next ``drip_rate`` recipients
+(a full chunk without a drip rate) while the send window is open, so
+WAHA, the workers and the database see a steady load.
+"""
+
+from __future__ import annotations
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+from frappe_whatsapp_waha.frappe_whatsapp_waha.doctype.bulk_whatsapp_message.bulk_whatsapp_message import (
+    CAMPAIGN_FIELDS,
+    PACING_FIELDS,
+    enqueue_chunk,
+    in_send_window,
+    is_paced,
+    release_page,
+    validate_before_release,
+)
+from frappe_whatsapp_waha.utils.recipients import (
+    fetch_recipient_page,
+    get_chunk_size,
+    get_recipient_source,
+)
+
+RELEASE_METHOD = "frappe_whatsapp_waha.utils.campaign_scheduler.release_campaign"
+RELEASABLE_STATUSES = ("Scheduled", "Queued", "In Progress")
+
+
+def release_due_campaigns() -> None:
+    """Start due campaigns and release the next slice of paced ones."""
+
+    campaigns = frappe.db.sql(
+        """
+        SELECT name, status, drip_rate, send_window_start, send_window_end, release_cursor
+        FROM `tabBulk WhatsApp Message`
+        WHERE docstatus = 1
+            AND status IN %(statuses)s
+            AND release_finished = 0
+            AND (scheduled_time IS NULL OR scheduled_time <= %(now)s)
+            AND (status = 'Scheduled' OR drip_rate > 0 OR send_window_start IS NOT NULL)
+        """,
+        {"statuses": RELEASABLE_STATUSES, "now": now_datetime()},
+        as_dict=True,
+    )
+
+    for campaign in campaigns:
+        if not is_paced(campaign):
+            frappe.db.set_value("Bulk WhatsApp Message", campaign.name, "status", "Queued", update_modified=False)
+            enqueue_chunk(campaign.name, campaign.release_cursor)
+        elif in_send_window(campaign.send_window_start, campaign.send_window_end):
+            frappe.enqueue(
+                RELEASE_METHOD,
+                queue="long",
+                timeout=4000,
+                job_id=f"whatsapp_campaign_release:{campaign.name}",
+                deduplicate=True,
+                enqueue_after_commit=True,
+                campaign=campaign.name,
+            )
+
+
+def release_campaign(campaign: str) -> None:
+    """Create the messages for the next slice of a paced campaign."""
+
+    # the row lock keeps a late job from releasing the same slice twice
+    header = frappe.db.get_value(
+        "Bulk WhatsApp Message",
+        campaign,
+        [*CAMPAIGN_FIELDS, *PACING_FIELDS],
+        as_dict=True,
+        for_update=True,
+    )
+    if not header or header.docstatus != 1 or header.status not in RELEASABLE_STATUSES:
+        return
+
+    if not in_send_window(header.send_window_start, header.send_window_end):
+        return
+
+    if not header.release_cursor and not validate_before_release(header):
+        return
+
+    limit = cint(header.drip_rate) or get_chunk_size()
+    parenttype, parent = get_recipient_source(header)
+    page = fetch_recipient_page(parenttype, parent, after=header.release_cursor, limit=limit)
+    release_page(header, page, last=len(page) < limit)
@@ -0,0 +1,86 @@
+"""Statuses of outgoing WhatsApp Messages and when each was reached.
+
+Statuses used to be stored as they came, from the app ("Success") and
+from WAHA ("sent", "SERVER_ACK", 3). ``normalise_status`` maps all of them
+to one fixed set, and the first time a message reaches Sent, Delivered,
+Read or Failed the time is stored in the matching ``*_at`` field, which
+the WhatsApp Delivery Latency report measures.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import frappe
+from frappe.utils import cstr, now_datetime
+
+STATUSES = ("Queued", "Sending", "Sent", "Delivered", "Read", "Failed", "Suppressed")
+
+TIMESTAMP_FIELDS = {
+    "Sent": "sent_at",
+    "Delivered": "delivered_at",
+    "Read": "read_at",
+    "Failed": "failed_at",
+}
+
+# receipts may arrive out of order; a message never moves back down
+_RANK = {"Sent": 1, "Delivered": 2, "Read": 3}
+
+_ALIASES = {
+    "success": "Sent",
+    "server": "Sent",
+    "server_ack": "Sent",
+    "device": "Delivered",
+    "delivery_ack": "Delivered",
+    "played": "Read",
+    "error": "Failed",
+}
+
+# WhatsApp's WebMessageInfo.Status, as sent in messages.update events;
+# PENDING (1) has not reached the server yet
+_ACK_CODES = {0: "Failed", 2: "Sent", 3: "Delivered", 4: "Read", 5: "Read"}
+
+
+def normalise_status(status: Any) -> str | None:
+    """Return ``status`` as one of ``STATUSES``, or None when it is not one."""
+
+    if isinstance(status, int) and not isinstance(status, bool):
+        return _ACK_CODES.get(status)
+
+    key = cstr(status).strip().lower().replace(" ", "_")
+    if key.lstrip("-").isdigit():
+        return _ACK_CODES.get(int(key))
+    return _ALIASES.get(key) or next((value for value in STATUSES if value.lower() == key), None)
+
+
+def advance(current: str | None, status: str | None) -> str | None:
+    """Return the status a message in ``current`` has after a receipt for ``status``."""
+
+    status = normalise_status(status)
+    current = normalise_status(current) or current
+    if not status:
+        return current
+
+    rank = _RANK.get(current, 0)
+    # once WhatsApp has the message, only a later receipt moves it on
+    if rank and _RANK.get(status, 0) <= rank:
+        return current
+    return status
+
+
+def stamp(doc: Any) -> None:
+    """Normalise the status of ``doc`` and record when it reached it.
+
+    Messages going out also record the WAHA session they are sent from.
+    """
+
+    if doc.type != "Outgoing":
+        return
+
+    doc.status = normalise_status(doc.status) or doc.status
+    fieldname = TIMESTAMP_FIELDS.get(doc.status)
+    if fieldname and not doc.get(fieldname):
+        doc.set(fieldname, now_datetime())
+
+    if doc.status in _RANK and not doc.get("waha_session"):
+        doc.waha_session = frappe.get_cached_doc("WhatsApp Settings").session or "default"
@@ -0,0 +1,118 @@
+"""Buffered writer for WhatsApp Notification Log entries."""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+import frappe
+from frappe.utils import cint, now
+
+LOG_FIELDS = (
+    "name",
+    "creation",
+    "modified",
+    "owner",
+    "modified_by",
+    "docstatus",
+    "idx",
+    "template",
+    "meta_data",
+)
+
+# site -> buffer; each worker process keeps its own
+_buffers: dict[str, "NotificationLogBuffer"] = {}
+
+
+class NotificationLogBuffer:
+    """Accumulate log rows and write them with multi-row inserts.
+
+    Rows are written once ``whatsapp_log_batch_size`` entries are waiting or
+    ``whatsapp_log_flush_interval`` seconds have passed since the last write.
+    Written rows are remembered until the transaction commits: a rollback
+    puts them back in the buffer, so they are written again by the flush at
+    the end of the job or request.
+    """
+
+    def __init__(self) -> None:
+        self._pending: list[tuple[Any, ...]] = []
+        self._uncommitted: list[tuple[Any, ...]] = []
+        self._last_flush = time.monotonic()
+        self._watching_transaction = False
+
+    def append(self, template: str, payload: Any, *, failed: bool = False) -> None:
+        if not failed and log_failures_only():
+            return
+
+        timestamp = now()
+        user = frappe.session.user
+        self._pending.append(
+            (
+                frappe.generate_hash(length=10),
+                timestamp,
+                timestamp,
+                user,
+                user,
+                0,
+                0,
+                template,
+                frappe.as_json(payload or {}),
+            )
+        )
+
+        batch_size = cint(frappe.conf.get("whatsapp_log_batch_size", 100))
+        interval = cint(frappe.conf.get("whatsapp_log_flush_interval", 10))
+        if len(self._pending) >= batch_size or time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def flush(self) -> int:
+        """Insert the buffered rows into the current transaction."""
+
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return 0
+
+        rows, self._pending = self._pending, []
+        frappe.db.bulk_insert("WhatsApp Notification Log", fields=LOG_FIELDS, values=rows)
+        self._uncommitted.extend(rows)
+
+        if not self._watching_transaction:
+            frappe.db.after_commit.add(self._on_commit)
+            frappe.db.after_rollback.add(self._on_rollback)
+            self._watching_transaction = True
+
+        return len(rows)
+
+    def _on_commit(self) -> None:
+        self._uncommitted = []
+        self._watching_transaction = False
+
+    def _on_rollback(self) -> None:
+        self._pending[:0] = self._uncommitted
+        self._uncommitted = []
+        self._watching_transaction = False
+
+
+def get_log_buffer() -> NotificationLogBuffer:
+    """Return the log buffer of the current site."""
+
+    return _buffers.setdefault(frappe.local.site, NotificationLogBuffer())
+
+
+def log_failures_only() -> bool:
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    return bool(cint(settings.get("log_failed_sends_only")))
+
+
+def flush_notification_logs(*args, **kwargs) -> None:
+    """Write and commit every buffered entry.
+
+    Registered as an ``after_job`` and ``after_request`` hook; by then the
+    job's own transaction has been committed or rolled back.
+    """
+
+    if getattr(frappe.local, "site", None) not in _buffers:
+        return
+
+    if get_log_buffer().flush():
+        frappe.db.commit()
@@ -0,0 +1,178 @@
+"""Pre-flight check of which numbers are on WhatsApp.
+
+Numbers are looked up on WAHA's check-exists endpoint by a small thread
+pool, spaced out to ``whatsapp_number_check_rate`` requests per second,
+and each answer is cached in Redis per normalised number for
+``whatsapp_number_check_ttl`` seconds. Campaigns skip numbers known not
+to be on WhatsApp, and sends use the chat id WAHA reported for a number.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+import threading
+import time
+from typing import Any, Iterable
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt
+
+from frappe_whatsapp_waha.utils.phone import as_chat_id, normalise
+from frappe_whatsapp_waha.utils.recipients import fetch_recipient_page, get_chunk_size, get_segment
+
+CHECK_METHOD = "frappe_whatsapp_waha.utils.number_check.check_recipient_list"
+STATUS_KEY = "whatsapp_number_status"
+
+ON_WHATSAPP = "On WhatsApp"
+NOT_ON_WHATSAPP = "Not on WhatsApp"
+
+
+def get_cached_statuses(numbers: Iterable[str]) -> dict[str, dict[str, Any]]:
+    """Return the cached status of each of ``numbers`` (normalised) that has one."""
+
+    numbers = list(numbers)
+    if not numbers:
+        return {}
+
+    cache = frappe.cache()
+    values = cache.mget([cache.make_key(f"{STATUS_KEY}:{number}") for number in numbers])
+    return {number: pickle.loads(value) for number, value in zip(numbers, values) if value is not None}
+
+
+def resolve_chat_id(phone: str) -> str:
+    """Return the chat id to send to, preferring the one WAHA reported."""
+
+    chat_id = as_chat_id(phone)
+    if not chat_id.endswith("@c.us"):
+        return chat_id
+
+    status = frappe.cache().get_value(f"{STATUS_KEY}:{chat_id.split('@', 1)[0]}")
+    return (status or {}).get("chat_id") or chat_id
+
+
+def check_numbers(numbers: Iterable[Any]) -> dict[str, dict[str, Any]]:
+    """Return ``{number: {"exists": bool, "chat_id": str | None}}`` for ``numbers``.
+
+    Numbers are normalised first; cached answers are used as they are and
+    the rest are asked from WAHA. Numbers WAHA could not answer for are
+    left out of the result.
+    """
+
+    # imported here, the client resolves chat ids through this module
+    from frappe_whatsapp_waha.frappe_whatsapp_waha.utils.waha_client import WahaAPIError, WahaClient
+
+    statuses: dict[str, dict[str, Any]] = {}
+    valid = set()
+    for number in numbers:
+        normalised = normalise(number)
+        if normalised:
+            valid.add(normalised)
+        elif number:
+            statuses[number] = {"exists": False, "chat_id": None}
+
+    cached = get_cached_statuses(valid)
+    statuses.update(cached)
+    pending = sorted(valid - cached.keys())
+    if not pending:
+        return statuses
+
+    client = WahaClient.from_settings()
+    limiter = _RateLimiter(flt(frappe.conf.get("whatsapp_number_check_rate", 10)))
+
+    def check(number: str) -> tuple[str, dict[str, Any] | None]:
+        limiter.wait()
+        try:
+            data = client.check_exists(number)
+        except WahaAPIError:
+            return number, None
+        return number, {"exists": bool(data.get("numberExists")), "chat_id": data.get("chatId")}
+
+    workers = max(cint(frappe.conf.get("whatsapp_number_check_workers", 4)), 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        checked = {number: status for number, status in pool.map(check, pending) if status}
+
+    _cache_statuses(checked)
+    statuses.update(checked)
+    return statuses
+
+
+def check_recipient_list(list_name: str) -> int:
+    """Check every number of ``list_name`` and record the result on its rows.
+
+    Dynamic segments have no rows; checking one only fills the cache.
+    Returns the number of recipients not on WhatsApp.
+    """
+
+    is_segment = bool(get_segment(list_name))
+    chunk_size = get_chunk_size()
+    total = frappe.db.count("WhatsApp Recipient", {"parenttype": "WhatsApp Recipient List", "parent": list_name})
+    after = None
+    read = missing = 0
+
+    while True:
+        page = fetch_recipient_page("WhatsApp Recipient List", list_name, after=after, limit=chunk_size)
+        if not page:
+            break
+        after = page[-1].name
+        read += len(page)
+
+        statuses = check_numbers(recipient.mobile_number for recipient in page)
+        marks: dict[str, list[str]] = {ON_WHATSAPP: [], NOT_ON_WHATSAPP: []}
+        for recipient in page:
+            status = statuses.get(normalise(recipient.mobile_number) or recipient.mobile_number)
+            if status:
+                marks[ON_WHATSAPP if status["exists"] else NOT_ON_WHATSAPP].append(recipient.name)
+
+        missing += len(marks[NOT_ON_WHATSAPP])
+        if not is_segment:
+            for whatsapp_status, names in marks.items():
+                if names:
+                    frappe.db.sql(
+                        "UPDATE `tabWhatsApp Recipient` SET whatsapp_status = %s WHERE name IN %s",
+                        (whatsapp_status, tuple(names)),
+                    )
+            frappe.db.commit()
+
+        frappe.publish_progress(
+            min(read * 100 / (total or read), 100),
+            title=_("Checking WhatsApp Numbers"),
+            doctype="WhatsApp Recipient List",
+            docname=list_name,
+            description=_("{0} numbers checked").format(read),
+        )
+
+        if len(page) < chunk_size:
+            break
+
+    return missing
+
+
+def _cache_statuses(statuses: dict[str, dict[str, Any]]) -> None:
+    if not statuses:
+        return
+
+    cache = frappe.cache()
+    ttl = max(cint(frappe.conf.get("whatsapp_number_check_ttl", 7 * 24 * 3600)), 1)
+    pipeline = cache.pipeline()
+    for number, status in statuses.items():
+        pipeline.set(cache.make_key(f"{STATUS_KEY}:{number}"), pickle.dumps(status), ex=ttl)
+    pipeline.execute()
+
+
+class _RateLimiter:
+    """Spaces out calls from any number of threads to ``rate`` per second."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            at = max(self.next_at, now)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
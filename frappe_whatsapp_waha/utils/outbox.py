@@ -0,0 +1,487 @@
+"""Outbox dispatcher for outgoing WhatsApp messages.
+
+With "Send Through Outbox" enabled in WhatsApp Settings, inserting an
+Outgoing WhatsApp Message only stores it as Queued. Dispatcher jobs then
+claim queued rows in batches, send them through WAHA and write the result
+back, independently of the transaction that created the message.
+
+Campaign messages always go through the dispatcher, whether or not the
+outbox is enabled: their rows are committed before anything is sent, so
+a campaign interrupted by a worker restart can be resumed from its
+messages' states (Queued, Sending or sent) without messaging anybody
+twice.
+
+Rows are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` and leased to
+the claiming worker for ``whatsapp_dispatch_lease`` seconds, so any number
+of dispatchers on any number of nodes can pull batches side by side
+without sending a message twice. A dispatcher never starts a send it
+could not finish within its lease; expired leases are reconciled and
+handed out again by the scheduler.
+
+Messages travel in priority lanes. Each batch is shared between the lanes
+by weight, and the campaign share is split evenly between the campaigns
+that are running, so transactional messages are never stuck behind a
+large campaign.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+import itertools
+import math
+import os
+import socket
+import time
+from typing import Any
+from zoneinfo import ZoneInfo
+
+import frappe
+from frappe.utils import add_to_date, cint, get_datetime, get_system_timezone, now_datetime
+
+from frappe_whatsapp_waha.frappe_whatsapp_waha.utils.waha_client import WahaAPIError, WahaClient
+from frappe_whatsapp_waha.utils.message_status import stamp
+from frappe_whatsapp_waha.utils.suppression import is_suppressed
+
+DISPATCH_METHOD = "frappe_whatsapp_waha.utils.outbox.dispatch"
+RECLAIM_METHOD = "frappe_whatsapp_waha.utils.outbox.reconcile_in_flight"
+
+LANES = ("Transactional", "Manual", "Campaign")
+DEFAULT_LANE_WEIGHTS = {"Transactional": 8, "Manual": 4, "Campaign": 1}
+ACTIVE_CAMPAIGN_STATUSES = ("Queued", "In Progress")
+LATENCY_KEY = "whatsapp_lane_latency"
+
+# rotates the campaign that is served first when there are more campaigns
+# than campaign slots in a batch
+_campaign_rotation = itertools.count()
+
+
+def outbox_enabled() -> bool:
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    return bool(cint(settings.get("use_outbox")))
+
+
+def kick_dispatcher() -> None:
+    """Start the dispatcher once the current transaction commits."""
+
+    if frappe.flags.whatsapp_dispatch_pending:
+        return
+
+    frappe.flags.whatsapp_dispatch_pending = True
+    frappe.db.after_commit.add(_start_after_commit)
+    frappe.db.after_rollback.add(_reset_pending)
+
+
+def start_dispatchers() -> None:
+    """Enqueue the dispatcher worker pool; running workers are not duplicated.
+
+    Raise ``whatsapp_dispatcher_workers`` when worker nodes are added, and
+    point ``whatsapp_dispatch_queue`` at a dedicated queue to keep
+    dispatchers off the short queue.
+    """
+
+    for worker in range(max(cint(frappe.conf.get("whatsapp_dispatcher_workers", 2)), 1)):
+        frappe.enqueue(
+            DISPATCH_METHOD,
+            queue=frappe.conf.get("whatsapp_dispatch_queue") or "short",
+            job_id=f"whatsapp_outbox_dispatch_{worker}",
+            deduplicate=True,
+        )
+
+
+def schedule_dispatch() -> None:
+    """Scheduler safety net for messages queued while no worker was running.
+
+    Also hands messages whose lease has expired to the reconciler.
+    """
+
+    if frappe.db.exists("WhatsApp Message", {"type": "Outgoing", "status": "Queued"}):
+        start_dispatchers()
+
+    if frappe.db.exists(
+        "WhatsApp Message",
+        {"type": "Outgoing", "status": "Sending", "lease_expires_at": ("<", now_datetime())},
+    ):
+        frappe.enqueue(RECLAIM_METHOD, queue="short", job_id="whatsapp_outbox_reclaim", deduplicate=True)
+
+
+def get_lease_duration() -> int:
+    return max(cint(frappe.conf.get("whatsapp_dispatch_lease", 300)), 60)
+
+
+def dispatch(batch_size: int | None = None, time_limit: int | None = None) -> int:
+    """Send queued messages batch by batch until the outbox is empty.
+
+    The outcome of every message, with the id WAHA gave it, is committed
+    as soon as it is known. Messages that could no longer be sent within
+    the lease are put back in the queue untouched. Should the worker die in
+    the middle of a batch, only the message being sent stays in Sending
+    until its lease expires and ``reconcile_in_flight`` settles it.
+
+    Returns the number of messages processed by this worker.
+    """
+
+    batch_size = batch_size or cint(frappe.conf.get("whatsapp_dispatch_batch_size", 50))
+    time_limit = time_limit or cint(frappe.conf.get("whatsapp_dispatch_time_limit", 240))
+    deadline = time.monotonic() + time_limit
+    # leave room for the send that is running when the lease runs out
+    lease = get_lease_duration() - cint(frappe.conf.get("waha_timeout", 30))
+    processed = 0
+
+    while time.monotonic() < deadline:
+        names = claim_batch(batch_size)
+        if not names:
+            break
+
+        lease_end = time.monotonic() + lease
+        for index, name in enumerate(names):
+            if time.monotonic() >= lease_end:
+                release_claimed(names[index:])
+                break
+            send_claimed(name)
+            frappe.db.commit()
+            processed += 1
+
+    return processed
+
+
+def claim_batch(batch_size: int) -> list[str]:
+    """Mark up to ``batch_size`` queued messages as Sending and return them.
+
+    Every lane first gets its weighted share of the batch; capacity a lane
+    does not use goes to the other lanes in priority order.
+    """
+
+    claimed: dict[str, list[tuple[str, object]]] = {lane: [] for lane in LANES}
+
+    for lane, quota in lane_quotas(batch_size).items():
+        if lane == "Campaign":
+            claimed[lane].extend(_claim_campaigns(quota))
+        else:
+            claimed[lane].extend(_claim(lane, quota))
+
+    spare = batch_size - sum(len(rows) for rows in claimed.values())
+    for lane in LANES:
+        if spare <= 0:
+            break
+        # campaign rows always go through the campaign filter, so paused
+        # campaigns stay parked
+        rows = _claim_campaigns(spare) if lane == "Campaign" else _claim(lane, spare)
+        claimed[lane].extend(rows)
+        spare -= len(rows)
+
+    frappe.db.commit()
+
+    _record_latency(claimed)
+    return [name for rows in claimed.values() for name, _creation in rows]
+
+
+def lane_quotas(batch_size: int) -> dict[str, int]:
+    """Split ``batch_size`` between the lanes according to their weights.
+
+    Shares are rounded down and the slots left over go to the lanes with
+    the largest remainders, so the quotas always add up to ``batch_size``.
+    """
+
+    weights = {**DEFAULT_LANE_WEIGHTS, **(frappe.conf.get("whatsapp_lane_weights") or {})}
+    weights = {lane: max(cint(weights.get(lane)), 0) for lane in LANES}
+    total = sum(weights.values())
+    if not total:
+        return {lane: 0 for lane in LANES}
+
+    quotas = {lane: batch_size * weight // total for lane, weight in weights.items()}
+    # ties go to the lane with the higher priority
+    by_remainder = sorted(LANES, key=lambda lane: -(batch_size * weights[lane] % total))
+    for lane in by_remainder[: batch_size - sum(quotas.values())]:
+        quotas[lane] += 1
+    return quotas
+
+
+def _claim(lane: str, limit: int, campaign: str | None = None) -> list[tuple[str, object]]:
+    if limit <= 0:
+        return []
+
+    conditions = "type = 'Outgoing' AND status = 'Queued' AND priority_lane = %(lane)s"
+    if campaign:
+        conditions += " AND bulk_message_reference = %(campaign)s"
+
+    rows = frappe.db.sql(
+        f"""
+        SELECT name, creation
+        FROM `tabWhatsApp Message`
+        WHERE {conditions}
+        ORDER BY creation
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+        """,
+        {"lane": lane, "campaign": campaign, "limit": limit},
+    )
+
+    if rows:
+        current = now_datetime()
+        frappe.db.set_value(
+            "WhatsApp Message",
+            {"name": ("in", [name for name, _creation in rows])},
+            {
+                "status": "Sending",
+                "dispatched_at": current,
+                "lease_expires_at": add_to_date(current, seconds=get_lease_duration()),
+                "leased_by": _worker_id(),
+            },
+            update_modified=False,
+        )
+
+    return [tuple(row) for row in rows]
+
+
+def _claim_campaigns(quota: int) -> list[tuple[str, object]]:
+    """Share the campaign quota evenly between the running campaigns.
+
+    Only campaigns that still have Queued messages are asked for rows.
+    They are found with one grouped read of the
+    (bulk_message_reference, status, creation) index, so finished or
+    paused campaigns do not cost a locking read on every batch.
+    """
+
+    if quota <= 0:
+        return []
+
+    waiting = frappe.db.sql_list(
+        """
+        SELECT bulk_message_reference
+        FROM `tabWhatsApp Message`
+        WHERE bulk_message_reference IS NOT NULL
+            AND status = 'Queued'
+        GROUP BY bulk_message_reference
+        """
+    )
+    if not waiting:
+        return []
+
+    campaigns = frappe.get_all(
+        "Bulk WhatsApp Message",
+        filters={"name": ("in", waiting), "docstatus": 1, "status": ("in", ACTIVE_CAMPAIGN_STATUSES)},
+        order_by="creation",
+        pluck="name",
+    )
+    if not campaigns:
+        return []
+
+    offset = next(_campaign_rotation) % len(campaigns)
+    campaigns = campaigns[offset:] + campaigns[:offset]
+    share = max(math.ceil(quota / len(campaigns)), 1)
+
+    rows: list[tuple[str, object]] = []
+    for campaign in campaigns:
+        remaining = quota - len(rows)
+        if remaining <= 0:
+            break
+        rows.extend(_claim("Campaign", min(share, remaining), campaign))
+
+    return rows
+
+
+def _record_latency(claimed: dict[str, list[tuple[str, object]]]) -> None:
+    """Keep a rolling window of queue latencies (queued -> claimed) per lane."""
+
+    window = cint(frappe.conf.get("whatsapp_lane_latency_window", 1000))
+    current = now_datetime()
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+
+    for lane, rows in claimed.items():
+        if not rows:
+            continue
+        key = cache.make_key(f"{LATENCY_KEY}:{lane}")
+        latencies = [round((current - get_datetime(creation)).total_seconds(), 3) for _name, creation in rows]
+        pipeline.lpush(key, *latencies)
+        pipeline.ltrim(key, 0, window - 1)
+
+    pipeline.execute()
+
+
+@frappe.whitelist()
+def get_lane_latency() -> dict[str, dict[str, float]]:
+    """Return queue latency percentiles, in seconds, for each lane."""
+
+    frappe.only_for("System Manager")
+
+    cache = frappe.cache()
+    stats: dict[str, dict[str, float]] = {}
+
+    for lane in LANES:
+        values = sorted(float(value) for value in cache.lrange(cache.make_key(f"{LATENCY_KEY}:{lane}"), 0, -1))
+        if not values:
+            stats[lane] = {"count": 0}
+            continue
+
+        stats[lane] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.5),
+            "p90": _percentile(values, 0.9),
+            "p99": _percentile(values, 0.99),
+            "max": values[-1],
+        }
+
+    return stats
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def send_claimed(name: str) -> None:
+    """Send one claimed message and write the outcome to the current transaction.
+
+    Messages to numbers suppressed after they were queued are not sent.
+    """
+
+    doc = frappe.get_doc("WhatsApp Message", name)
+
+    if is_suppressed(doc.to):
+        doc.status = "Suppressed"
+    else:
+        try:
+            doc.send()
+        except Exception as exc:
+            doc.status = "Failed"
+            if not isinstance(exc, frappe.ValidationError):
+                frappe.log_error(title="WhatsApp Outbox Error", message=frappe.get_traceback())
+            frappe.clear_messages()
+
+    stamp(doc)
+    doc.db_update()
+    doc.record_status_change("Queued")
+
+
+def release_claimed(names: list[str]) -> None:
+    """Put claimed messages that were not attempted back in the queue."""
+
+    frappe.db.sql(
+        """
+        UPDATE `tabWhatsApp Message`
+        SET status = 'Queued', lease_expires_at = NULL, leased_by = NULL
+        WHERE name IN %(names)s AND status = 'Sending' AND leased_by = %(worker)s
+        """,
+        {"names": tuple(names), "worker": _worker_id()},
+    )
+
+
+def reconcile_in_flight(campaign: str | None = None) -> int:
+    """Settle messages whose lease expired while they were in Sending.
+
+    A message is in flight from the moment it is claimed until its outcome
+    is committed, so WAHA may or may not have sent it. Instead of sending
+    it again, the chat is looked up on WAHA: an outgoing message sent after
+    the dispatch time with the same text and media, and not already
+    recorded for another WhatsApp Message, means it went out; otherwise it
+    is queued again.
+    Live dispatchers stop sending before their lease expires, so they are
+    left alone. Chats that cannot be checked stay in flight for the next
+    run.
+
+    Returns the number of messages settled.
+    """
+
+    # take the expired leases over first, so that concurrent reconcilers
+    # never settle the same message twice
+    condition = " AND bulk_message_reference = %(campaign)s" if campaign else ""
+    current = now_datetime()
+    names = frappe.db.sql_list(
+        f"""
+        SELECT name
+        FROM `tabWhatsApp Message`
+        WHERE type = 'Outgoing' AND status = 'Sending' AND lease_expires_at < %(now)s{condition}
+        ORDER BY lease_expires_at
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+        """,
+        {"now": current, "campaign": campaign, "limit": cint(frappe.conf.get("whatsapp_reconcile_batch_size", 500))},
+    )
+    if not names:
+        return 0
+
+    frappe.db.set_value(
+        "WhatsApp Message",
+        {"name": ("in", names)},
+        {"lease_expires_at": add_to_date(current, seconds=get_lease_duration()), "leased_by": _worker_id()},
+        update_modified=False,
+    )
+    frappe.db.commit()
+
+    client = WahaClient.from_settings()
+    timezone = ZoneInfo(get_system_timezone())
+    settled = 0
+
+    for name in names:
+        doc = frappe.get_doc("WhatsApp Message", name)
+        dispatched_at = get_datetime(doc.dispatched_at).replace(tzinfo=timezone).timestamp()
+
+        try:
+            chat = client.get_chat_messages(doc.chat_id or doc.to)
+        except WahaAPIError:
+            # checked again once the lease taken above expires
+            continue
+
+        sent = _find_sent(doc, chat, dispatched_at)
+        if sent:
+            doc.status = "Sent"
+            doc.message_id = doc.message_id or sent.get("id")
+            if sent.get("timestamp"):
+                doc.sent_at = datetime.fromtimestamp(sent["timestamp"], timezone).replace(tzinfo=None)
+        else:
+            doc.status = "Queued"
+
+        doc.lease_expires_at = None
+        doc.leased_by = None
+        stamp(doc)
+        doc.db_update()
+        doc.record_status_change("Sending")
+        frappe.db.commit()
+        settled += 1
+
+    return settled
+
+
+def _find_sent(doc, chat: list[dict[str, Any]], dispatched_at: float) -> dict[str, Any] | None:
+    """Return the message of ``chat`` that WAHA sent for ``doc``, if any.
+
+    Notifications, replies and other campaigns write to the same chat, so
+    only a message with the same content counts, and never one whose id
+    already belongs to another WhatsApp Message.
+    """
+
+    text, has_media = doc.outgoing_content()
+    candidates = [
+        message
+        for message in chat
+        if message.get("fromMe")
+        and (message.get("timestamp") or 0) >= dispatched_at
+        and (message.get("body") or "").strip() == text.strip()
+        and bool(message.get("hasMedia")) == has_media
+        and message.get("id")
+    ]
+    if not candidates:
+        return None
+
+    recorded = set(
+        frappe.get_all(
+            "WhatsApp Message",
+            filters={"message_id": ("in", [message["id"] for message in candidates]), "name": ("!=", doc.name)},
+            pluck="message_id",
+        )
+    )
+    # the chat is newest first; the oldest match is the one sent first
+    return next((message for message in reversed(candidates) if message["id"] not in recorded), None)
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _start_after_commit() -> None:
+    frappe.flags.whatsapp_dispatch_pending = False
+    start_dispatchers()
+
+
+def _reset_pending() -> None:
+    frappe.flags.whatsapp_dispatch_pending = False
@@ -0,0 +1,108 @@
+"""Normalisation of phone numbers to E.164.
+
+Every number the app stores for a recipient or sends to goes through
+``normalise``, so that ``0501234567``, ``+972 50-123-4567`` and
+``972501234567@c.us`` all become the same recipient. Numbers are kept as
+E.164 digits without the leading '+', the form WAHA chat ids and the
+webhook use. Results are memoised per process, since the same numbers
+come back on every campaign.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+import re
+from typing import Any, Iterable, Iterator
+
+import frappe
+from frappe.utils import cstr
+
+# E.164 allows at most 15 digits; shorter ones cannot carry a country code
+MIN_DIGITS = 8
+MAX_DIGITS = 15
+
+_SEPARATORS = re.compile(r"[\s\-(). /]")
+_DIALLABLE = re.compile(r"\+?\d+")
+
+
+def get_default_country_code() -> str:
+    """Calling code applied to numbers in national format, from WhatsApp Settings."""
+
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    return "".join(char for char in cstr(settings.get("default_country_code")) if char.isdigit())
+
+
+def normalise(number: Any, country_code: str | None = None) -> str | None:
+    """Return ``number`` as E.164 digits, or None when it is not a valid number.
+
+    ``country_code`` defaults to the site's default country code.
+    """
+
+    if country_code is None:
+        country_code = get_default_country_code()
+    return _normalise(cstr(number), country_code)
+
+
+def normalise_many(numbers: Iterable[Any], country_code: str | None = None) -> list[str | None]:
+    """Normalise ``numbers`` in one pass, reading the default country code once."""
+
+    if country_code is None:
+        country_code = get_default_country_code()
+    return [_normalise(cstr(number), country_code) for number in numbers]
+
+
+def deduplicate(
+    recipients: Iterable[Any],
+    seen: set[str] | None = None,
+    field: str = "mobile_number",
+    country_code: str | None = None,
+) -> Iterator[Any]:
+    """Yield the recipients whose normalised ``field`` has not been seen yet.
+
+    Pass ``seen`` to carry the numbers across calls, e.g. from page to page.
+    Invalid numbers are compared as they are.
+    """
+
+    if country_code is None:
+        country_code = get_default_country_code()
+    seen = set() if seen is None else seen
+    for recipient in recipients:
+        number = cstr(recipient.get(field)).strip()
+        number = _normalise(number, country_code) or number
+        if number in seen:
+            continue
+        seen.add(number)
+        yield recipient
+
+
+def as_chat_id(number: str, country_code: str | None = None) -> str:
+    """Return the WAHA chat id of ``number``; chat and group ids pass through."""
+
+    number = (number or "").strip()
+    if "@" in number:
+        return number
+    return f"{normalise(number, country_code) or number.lstrip('+')}@c.us"
+
+
+@lru_cache(maxsize=100_000)
+def _normalise(number: str, country_code: str) -> str | None:
+    # WhatsApp ids such as 972501234567@c.us or 972501234567:12@s.whatsapp.net
+    number = number.split("@", 1)[0].split(":", 1)[0]
+    number = _SEPARATORS.sub("", number)
+    if not _DIALLABLE.fullmatch(number):
+        return None
+
+    if number.startswith("+"):
+        digits = number[1:]
+    elif number.startswith("00"):
+        # international call prefix
+        digits = number[2:]
+    elif number.startswith("0") and country_code:
+        # national trunk prefix
+        digits = country_code + number[1:]
+    else:
+        digits = number
+
+    if digits.startswith("0") or not MIN_DIGITS <= len(digits) <= MAX_DIGITS:
+        return None
+    return digits
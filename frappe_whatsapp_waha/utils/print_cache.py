@@ -0,0 +1,133 @@
+"""Cache rendered print PDFs that are sent as WhatsApp attachments.
+
+Prints are stored as private Files. WAHA cannot log in to the site, so it
+downloads them through ``download_print`` with a token derived from the
+site encryption key, the way share keys let it download live prints.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+from typing import Any
+from urllib.parse import urlencode
+
+import frappe
+from frappe.utils import cstr, get_datetime, get_url
+from frappe.utils.password import get_encryption_key
+
+FILE_PREFIX = "whatsapp-print"
+DOWNLOAD_METHOD = "frappe_whatsapp_waha.utils.print_cache.download_print"
+
+
+def get_print_format(doctype: str) -> str:
+    """Return the default print format configured for ``doctype``.
+
+    The meta already carries any ``default_print_format`` property setter,
+    so standard and custom DocTypes resolve the same way.
+    """
+
+    return frappe.get_meta(doctype).default_print_format or "Standard"
+
+
+def get_print_file_name(doctype: str, name: str, print_format: str, modified: Any) -> str:
+    """Return the cache file name for a document version and print format.
+
+    The digest is salted with the site encryption key, so the name of a
+    print does not give away the document it belongs to.
+    """
+
+    version = get_datetime(modified).strftime("%Y-%m-%d %H:%M:%S.%f")
+    key = "\0".join((doctype, name, print_format, version, get_encryption_key()))
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return f"{FILE_PREFIX}-{frappe.scrub(print_format)}-{digest}.pdf"
+
+
+def get_cached_print_url(doctype: str, name: str, print_format: str, modified: Any) -> str | None:
+    """Return the URL of an already rendered print, if there is one."""
+
+    file_name = frappe.db.get_value(
+        "File",
+        {
+            "attached_to_doctype": doctype,
+            "attached_to_name": name,
+            "file_name": get_print_file_name(doctype, name, print_format, modified),
+        },
+        "name",
+    )
+    return get_print_url(file_name) if file_name else None
+
+
+def get_print_url(file_name: str) -> str:
+    """Return the URL WAHA downloads the print stored in File ``file_name`` from."""
+
+    return get_url(f"/api/method/{DOWNLOAD_METHOD}?" + urlencode({"file": file_name, "token": _token(file_name)}))
+
+
+def _token(file_name: str) -> str:
+    return hmac.new(get_encryption_key().encode(), file_name.encode(), hashlib.sha256).hexdigest()
+
+
+def render_print_file(doc, print_format: str) -> str:
+    """Render ``doc`` once for ``print_format`` and return the file URL.
+
+    Prints of older versions of the document are removed once the new file
+    has been stored.
+    """
+
+    cached = get_cached_print_url(doc.doctype, doc.name, print_format, doc.modified)
+    if cached:
+        return cached
+
+    pdf = frappe.get_print(doc.doctype, doc.name, print_format, doc=doc, as_pdf=True)
+    file_doc = frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": get_print_file_name(doc.doctype, doc.name, print_format, doc.modified),
+            "attached_to_doctype": doc.doctype,
+            "attached_to_name": doc.name,
+            "content": pdf,
+            "is_private": 1,
+        }
+    ).insert(ignore_permissions=True)
+
+    _remove_stale_prints(doc.doctype, doc.name, print_format, keep=file_doc.name)
+    return get_print_url(file_doc.name)
+
+
+def _remove_stale_prints(doctype: str, name: str, print_format: str, *, keep: str) -> None:
+    """Delete older prints, except those messages waiting in the outbox still link to."""
+
+    stale = frappe.get_all(
+        "File",
+        filters={
+            "attached_to_doctype": doctype,
+            "attached_to_name": name,
+            "file_name": ["like", f"{FILE_PREFIX}-{frappe.scrub(print_format)}-%"],
+            "name": ["!=", keep],
+        },
+        pluck="name",
+    )
+    for file_name in stale:
+        if frappe.db.exists(
+            "WhatsApp Message",
+            {"status": ("in", ("Queued", "Sending")), "attach": ("like", f"%token={_token(file_name)}")},
+        ):
+            continue
+        frappe.delete_doc("File", file_name, ignore_permissions=True)
+
+
+@frappe.whitelist(allow_guest=True)
+def download_print(file: str, token: str) -> None:
+    """Serve a cached print to WAHA."""
+
+    if not hmac.compare_digest(cstr(token), _token(cstr(file))):
+        raise frappe.PermissionError
+
+    file_doc = frappe.get_doc("File", file)
+    if not cstr(file_doc.file_name).startswith(FILE_PREFIX):
+        raise frappe.PermissionError
+
+    frappe.local.response.filename = f"{file_doc.attached_to_name}.pdf"
+    frappe.local.response.filecontent = file_doc.get_content()
+    frappe.local.response.type = "pdf"
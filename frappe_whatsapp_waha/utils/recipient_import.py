@@ -0,0 +1,679 @@
+"""Background import and sync of WhatsApp Recipient List rows.
+
+Source records are read with a keyset cursor, or uploaded CSV/XLSX files
+row by row, and written as WhatsApp Recipient rows with multi-row
+inserts, one committed chunk at a time, so memory use does not depend on
+the size of the list. Numbers are normalised to E.164 and each number is
+kept once per list.
+
+Every row remembers its source record, and every run records the time it
+started as the list's sync watermark. A sync then only reads the records
+modified or deleted since the watermark and touches the matching rows.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+from typing import Any, Iterable, Iterator
+
+import frappe
+from frappe import _
+from frappe.utils import cint, now, now_datetime
+
+from frappe_whatsapp_waha.utils.phone import deduplicate, get_default_country_code, normalise
+
+IMPORT_METHOD = "frappe_whatsapp_waha.utils.recipient_import.import_from_doctype"
+SYNC_METHOD = "frappe_whatsapp_waha.utils.recipient_import.sync_from_doctype"
+UPLOAD_METHOD = "frappe_whatsapp_waha.utils.recipient_import.import_from_file"
+IMPORT_EVENT = "whatsapp_recipient_import"
+
+# list type whose recipients are read from the source at send time
+DYNAMIC_SEGMENT = "Dynamic Segment"
+
+RECIPIENT_FIELDS = (
+    "name",
+    "creation",
+    "modified",
+    "owner",
+    "modified_by",
+    "docstatus",
+    "idx",
+    "parent",
+    "parenttype",
+    "parentfield",
+    "mobile_number",
+    "recipient_name",
+    "recipient_data",
+    "reference_name",
+)
+
+LIST_SETTINGS = (
+    "doctype_to_import",
+    "mobile_field",
+    "name_field",
+    "import_filters",
+    "import_limit",
+    "data_fields",
+    "last_synced_on",
+)
+
+UPLOAD_EXTENSIONS = (".csv", ".xlsx")
+ERROR_REPORT_HEADER = ("Row", "Mobile Number", "Recipient Name", "Error")
+
+
+def get_import_chunk_size() -> int:
+    return max(cint(frappe.conf.get("whatsapp_import_chunk_size", 1000)), 1)
+
+
+def enqueue_import(list_name: str, method: str = IMPORT_METHOD, **kwargs: Any) -> None:
+    """Start the import or sync job of ``list_name``; a running one is not duplicated."""
+
+    if frappe.db.get_value("WhatsApp Recipient List", list_name, "list_type") == DYNAMIC_SEGMENT:
+        frappe.throw(_("Dynamic segments are read when a campaign is sent and are never imported"))
+
+    set_import_status(list_name, "Queued")
+    frappe.enqueue(
+        method,
+        queue="long",
+        timeout=6 * 3600,
+        job_id=f"whatsapp_recipient_import:{list_name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        list_name=list_name,
+        **kwargs,
+    )
+
+
+def import_from_doctype(
+    list_name: str,
+    doctype: str,
+    mobile_field: str,
+    name_field: str | None = None,
+    filters: Any = None,
+    limit: int | None = None,
+    data_fields: list[str] | None = None,
+) -> int:
+    """Replace the recipients of ``list_name`` with records of ``doctype``.
+
+    Returns the number of recipients imported.
+    """
+
+    limit = cint(limit)
+    total = frappe.db.count(doctype, filters=filters)
+    if limit:
+        total = min(total, limit)
+
+    started_at = now_datetime()
+    set_import_status(list_name, "In Progress")
+    frappe.db.set_value("WhatsApp Recipient List", list_name, "imported_count", 0, update_modified=False)
+    clear_recipients(list_name)
+    frappe.db.commit()
+
+    fields = source_fields(doctype, mobile_field, name_field, data_fields)
+    chunk_size = get_import_chunk_size()
+    country_code = get_default_country_code()
+    seen: set[str] = set()
+    after = None
+    read = imported = 0
+
+    try:
+        while True:
+            page_size = min(chunk_size, limit - read) if limit else chunk_size
+            if page_size <= 0:
+                break
+
+            records = frappe.get_all(
+                doctype,
+                filters=source_filters(doctype, filters, after),
+                fields=fields,
+                order_by="name asc",
+                limit=page_size,
+            )
+            if not records:
+                break
+
+            read += len(records)
+            after = records[-1].name
+            recipients = (build_recipient(record, mobile_field, name_field, data_fields, country_code) for record in records)
+            imported += insert_recipients(list_name, deduplicate(filter(None, recipients), seen), start_idx=imported)
+
+            frappe.db.set_value("WhatsApp Recipient List", list_name, "imported_count", imported, update_modified=False)
+            frappe.db.commit()
+            frappe.publish_progress(
+                read * 100 / (total or read),
+                title=_("Importing Recipients"),
+                doctype="WhatsApp Recipient List",
+                docname=list_name,
+                description=_("{0} of {1} records read").format(read, total),
+            )
+
+            if len(records) < page_size:
+                break
+    except Exception:
+        frappe.db.rollback()
+        set_import_status(list_name, "Failed")
+        frappe.db.commit()
+        frappe.log_error(title="WhatsApp Recipient Import", message=frappe.get_traceback())
+        raise
+
+    _finish(list_name, started_at, imported)
+    return imported
+
+
+def import_from_file(
+    list_name: str,
+    file_url: str,
+    mobile_column: str,
+    name_column: str | None = None,
+    data_columns: list[str] | None = None,
+    append: bool = False,
+) -> int:
+    """Import the rows of an uploaded CSV or XLSX file into ``list_name``.
+
+    The file is read one row at a time and written in chunks. Rows without
+    a usable number are skipped and listed in an error report attached to
+    the list. Returns the number of recipients imported.
+    """
+
+    path = get_upload_path(file_url)
+    header = read_header(path)
+    data_columns = [column for column in data_columns or header if column not in (mobile_column, name_column)]
+    total = count_rows(path)
+
+    set_import_status(list_name, "In Progress")
+    frappe.db.set_value(
+        "WhatsApp Recipient List",
+        list_name,
+        {"imported_count": 0, "import_error_log": None},
+        update_modified=False,
+    )
+    next_idx = 0
+    seen: set[str] = set()
+    if append:
+        next_idx = cint(
+            frappe.db.sql(
+                "SELECT MAX(idx) FROM `tabWhatsApp Recipient` WHERE parenttype = 'WhatsApp Recipient List' AND parent = %s",
+                list_name,
+            )[0][0]
+        )
+        seen.update(
+            frappe.get_all(
+                "WhatsApp Recipient",
+                filters={"parenttype": "WhatsApp Recipient List", "parent": list_name},
+                pluck="mobile_number",
+            )
+        )
+    else:
+        clear_recipients(list_name)
+    frappe.db.commit()
+
+    chunk_size = get_import_chunk_size()
+    country_code = get_default_country_code()
+    errors = io.StringIO()
+    error_writer = csv.writer(errors)
+    read = imported = failed = 0
+    chunk = []
+
+    try:
+        rows = iter_file_rows(path)
+        next(rows, None)
+        for row_number, values in enumerate(rows, start=2):
+            record = frappe._dict(zip(header, values))
+            if not any(record.values()):
+                continue
+
+            read += 1
+            recipient = build_recipient(record, mobile_column, name_column, data_columns, country_code)
+            if not recipient:
+                error = "Mobile number is missing or invalid"
+            elif recipient["mobile_number"] in seen:
+                error = "Duplicate number"
+            else:
+                error = None
+                seen.add(recipient["mobile_number"])
+                # rows of a file have no source record to sync against
+                recipient.pop("reference_name", None)
+                chunk.append(recipient)
+
+            if error:
+                failed += 1
+                error_writer.writerow((row_number, record.get(mobile_column), record.get(name_column), error))
+
+            if len(chunk) >= chunk_size:
+                imported += _write_file_chunk(list_name, chunk, next_idx + imported, read, total)
+                chunk = []
+
+        if chunk:
+            imported += _write_file_chunk(list_name, chunk, next_idx + imported, read, total)
+    except Exception:
+        frappe.db.rollback()
+        set_import_status(list_name, "Failed")
+        frappe.db.commit()
+        frappe.log_error(title="WhatsApp Recipient Upload", message=frappe.get_traceback())
+        raise
+
+    if failed:
+        _attach_error_report(list_name, errors.getvalue())
+
+    frappe.db.set_value(
+        "WhatsApp Recipient List",
+        list_name,
+        {"import_status": "Completed", "imported_count": next_idx + imported},
+        update_modified=False,
+    )
+    frappe.publish_realtime(
+        IMPORT_EVENT,
+        {"list_name": list_name, "status": "Completed", "imported": imported, "failed": failed},
+        doctype="WhatsApp Recipient List",
+        docname=list_name,
+        after_commit=True,
+    )
+    return imported
+
+
+def sync_from_doctype(list_name: str) -> int:
+    """Apply the source changes since the last sync to ``list_name``.
+
+    Changed records are upserted, keeping the name of existing rows so that
+    running campaigns see the same recipient; records that were deleted or
+    no longer match the filters are removed. Lists without a watermark, or
+    with an import limit, are rebuilt instead.
+
+    Returns the number of recipient rows written or removed.
+    """
+
+    settings = frappe.db.get_value("WhatsApp Recipient List", list_name, LIST_SETTINGS, as_dict=True)
+    if not settings or not settings.doctype_to_import or not settings.mobile_field:
+        return 0
+
+    doctype = settings.doctype_to_import
+    filters = json.loads(settings.import_filters) if settings.import_filters else None
+    data_fields = json.loads(settings.data_fields) if settings.data_fields else None
+
+    if not settings.last_synced_on or cint(settings.import_limit):
+        return import_from_doctype(
+            list_name,
+            doctype,
+            settings.mobile_field,
+            name_field=settings.name_field,
+            filters=filters,
+            limit=settings.import_limit,
+            data_fields=data_fields,
+        )
+
+    started_at = now_datetime()
+    set_import_status(list_name, "In Progress")
+    frappe.db.commit()
+
+    fields = source_fields(doctype, settings.mobile_field, settings.name_field, data_fields)
+    changed = [[doctype, "modified", ">", settings.last_synced_on]]
+    chunk_size = get_import_chunk_size()
+    country_code = get_default_country_code()
+    next_idx = cint(
+        frappe.db.sql(
+            "SELECT MAX(idx) FROM `tabWhatsApp Recipient` WHERE parenttype = 'WhatsApp Recipient List' AND parent = %s",
+            list_name,
+        )[0][0]
+    )
+    after = None
+    written = 0
+
+    try:
+        while True:
+            # read without the list filters, to also see records that left them
+            records = frappe.get_all(
+                doctype,
+                filters=source_filters(doctype, changed, after),
+                fields=fields,
+                order_by="name asc",
+                limit=chunk_size,
+            )
+            if not records:
+                break
+            after = records[-1].name
+
+            names = [record.name for record in records]
+            matching = set(frappe.get_all(doctype, filters=[*source_filters(doctype, filters, None), [doctype, "name", "in", names]], pluck="name"))
+            existing = dict(_recipient_rows(list_name, names))
+
+            removed, added = [], []
+            for record in records:
+                recipient = None
+                if record.name in matching:
+                    recipient = build_recipient(record, settings.mobile_field, settings.name_field, data_fields, country_code)
+
+                row = existing.get(record.name)
+                if not recipient:
+                    if row:
+                        removed.append(row)
+                elif row:
+                    frappe.db.set_value("WhatsApp Recipient", row, {
+                        "mobile_number": recipient["mobile_number"],
+                        "recipient_name": recipient.get("recipient_name"),
+                        "recipient_data": recipient["recipient_data"],
+                    })
+                    written += 1
+                else:
+                    added.append(recipient)
+
+            if removed:
+                frappe.db.delete("WhatsApp Recipient", {"name": ("in", removed)})
+            if added:
+                # numbers the list already holds are not added twice
+                listed = set(
+                    frappe.get_all(
+                        "WhatsApp Recipient",
+                        filters={
+                            "parenttype": "WhatsApp Recipient List",
+                            "parent": list_name,
+                            "mobile_number": ("in", [recipient["mobile_number"] for recipient in added]),
+                        },
+                        pluck="mobile_number",
+                    )
+                )
+                added = list(deduplicate(added, listed))
+            inserted = insert_recipients(list_name, added, start_idx=next_idx)
+            next_idx += inserted
+            written += inserted + len(removed)
+            frappe.db.commit()
+
+            if len(records) < chunk_size:
+                break
+
+        written += _remove_deleted(list_name, doctype, settings.last_synced_on)
+    except Exception:
+        frappe.db.rollback()
+        set_import_status(list_name, "Failed")
+        frappe.db.commit()
+        frappe.log_error(title="WhatsApp Recipient Sync", message=frappe.get_traceback())
+        raise
+
+    _finish(list_name, started_at, frappe.db.count("WhatsApp Recipient", {"parenttype": "WhatsApp Recipient List", "parent": list_name}))
+    return written
+
+
+def sync_nightly_lists() -> None:
+    """Scheduler entry point syncing every list marked Sync Nightly."""
+
+    for list_name in frappe.get_all(
+        "WhatsApp Recipient List",
+        filters={"sync_nightly": 1, "import_from_doctype": 1, "list_type": ("!=", DYNAMIC_SEGMENT)},
+        pluck="name",
+    ):
+        enqueue_import(list_name, SYNC_METHOD)
+
+
+def get_upload_path(file_url: str) -> str:
+    """Return the path on disk of an uploaded CSV or XLSX file."""
+
+    file_doc = frappe.get_doc("File", {"file_url": file_url})
+    path = file_doc.get_full_path()
+    if os.path.splitext(path)[1].lower() not in UPLOAD_EXTENSIONS:
+        frappe.throw(_("Upload a CSV or XLSX file"))
+    return path
+
+
+def read_header(path: str) -> list[str]:
+    """Return the column names of the first row of ``path``."""
+
+    header = next(iter_file_rows(path), None)
+    if not header:
+        frappe.throw(_("The uploaded file is empty"))
+    return header
+
+
+def iter_file_rows(path: str) -> Iterator[list[str]]:
+    """Yield the rows of a CSV or XLSX file as lists of strings, one at a time."""
+
+    if path.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield [_cell(value) for value in row]
+        finally:
+            workbook.close()
+        return
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            yield [value.strip() for value in row]
+
+
+def count_rows(path: str) -> int:
+    """Return the number of data rows of ``path``, for progress reporting."""
+
+    if path.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            return max(cint(workbook.active.max_row) - 1, 0)
+        finally:
+            workbook.close()
+
+    # parsed rather than counting newlines, since quoted cells may span lines;
+    # the file is still streamed
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = sum(1 for _row in csv.reader(f))
+    return max(rows - 1, 0)
+
+
+def build_recipient(
+    record: Any,
+    mobile_field: str,
+    name_field: str | None = None,
+    data_fields: Iterable[str] | None = None,
+    country_code: str | None = None,
+) -> dict[str, Any] | None:
+    """Turn a source record into recipient values; None when it has no valid number.
+
+    The number is normalised to E.164 with ``country_code``, by default the
+    site's default country code.
+    """
+
+    mobile = normalise(record.get(mobile_field), country_code)
+    if not mobile:
+        return None
+
+    recipient_data = {}
+    for field in data_fields or ():
+        if record.get(field):
+            # Use field name as the variable name in recipient data
+            recipient_data[field.lower().replace(" ", "_")] = record.get(field)
+
+    recipient = {
+        "mobile_number": mobile,
+        "recipient_data": json.dumps(recipient_data, default=str),
+        "reference_name": record.get("name"),
+    }
+    if name_field and record.get(name_field):
+        recipient["recipient_name"] = record.get(name_field)
+    return recipient
+
+
+def insert_recipients(list_name: str, recipients: Iterable[dict[str, Any] | None], *, start_idx: int = 0) -> int:
+    """Append ``recipients`` to ``list_name`` with one multi-row insert.
+
+    Empty entries are skipped. Returns the number of rows written.
+    """
+
+    timestamp = now()
+    user = frappe.session.user
+    rows = []
+
+    for recipient in recipients:
+        if not recipient:
+            continue
+        rows.append(
+            (
+                frappe.generate_hash(length=10),
+                timestamp,
+                timestamp,
+                user,
+                user,
+                0,
+                start_idx + len(rows) + 1,
+                list_name,
+                "WhatsApp Recipient List",
+                "recipients",
+                recipient["mobile_number"],
+                recipient.get("recipient_name"),
+                recipient.get("recipient_data") or "{}",
+                recipient.get("reference_name"),
+            )
+        )
+
+    if rows:
+        frappe.db.bulk_insert("WhatsApp Recipient", fields=RECIPIENT_FIELDS, values=rows)
+    return len(rows)
+
+
+def clear_recipients(list_name: str) -> None:
+    frappe.db.delete("WhatsApp Recipient", {"parenttype": "WhatsApp Recipient List", "parent": list_name})
+
+
+def set_import_status(list_name: str, status: str) -> None:
+    frappe.db.set_value("WhatsApp Recipient List", list_name, "import_status", status, update_modified=False)
+
+
+def source_fields(doctype: str, mobile_field: str, name_field: str | None, data_fields: Any) -> list[str]:
+    """Return the fields of ``doctype`` read to build a recipient."""
+
+    fields = ["name", mobile_field]
+    if name_field:
+        fields.append(name_field)
+    if data_fields:
+        meta = frappe.get_meta(doctype)
+        fields.extend(df.fieldname for df in meta.fields if df.fieldname not in fields and df.fieldname in data_fields)
+    return fields
+
+
+def source_filters(doctype: str, filters: Any, after: str | None) -> list[list[Any]]:
+    """Return ``filters`` as a filter list limited to records named after ``after``."""
+
+    if isinstance(filters, dict):
+        conditions = [
+            [doctype, key, *(value if isinstance(value, (list, tuple)) else ("=", value))]
+            for key, value in filters.items()
+        ]
+    else:
+        conditions = list(filters or [])
+
+    if after:
+        conditions.append([doctype, "name", ">", after])
+    return conditions
+
+
+def _finish(list_name: str, started_at: Any, imported: int) -> None:
+    frappe.db.set_value(
+        "WhatsApp Recipient List",
+        list_name,
+        {"import_status": "Completed", "imported_count": imported, "last_synced_on": started_at},
+        update_modified=False,
+    )
+    frappe.publish_realtime(
+        IMPORT_EVENT,
+        {"list_name": list_name, "status": "Completed", "imported": imported},
+        doctype="WhatsApp Recipient List",
+        docname=list_name,
+        after_commit=True,
+    )
+
+
+def _write_file_chunk(list_name: str, chunk: list[dict[str, Any]], start_idx: int, read: int, total: int) -> int:
+    inserted = insert_recipients(list_name, chunk, start_idx=start_idx)
+    frappe.db.set_value(
+        "WhatsApp Recipient List",
+        list_name,
+        "imported_count",
+        start_idx + inserted,
+        update_modified=False,
+    )
+    frappe.db.commit()
+    frappe.publish_progress(
+        min(read * 100 / (total or read), 100),
+        title=_("Uploading Recipients"),
+        doctype="WhatsApp Recipient List",
+        docname=list_name,
+        description=_("{0} of {1} rows read").format(read, total),
+    )
+    return inserted
+
+
+def _attach_error_report(list_name: str, rows: str) -> None:
+    """Attach the rows that could not be imported to the list as a CSV file."""
+
+    report = io.StringIO()
+    csv.writer(report).writerow(ERROR_REPORT_HEADER)
+    report.write(rows)
+
+    file_doc = frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": f"{frappe.scrub(list_name)}_upload_errors.csv",
+            "attached_to_doctype": "WhatsApp Recipient List",
+            "attached_to_name": list_name,
+            "is_private": 1,
+            "content": report.getvalue(),
+        }
+    ).insert(ignore_permissions=True)
+    frappe.db.set_value(
+        "WhatsApp Recipient List",
+        list_name,
+        "import_error_log",
+        file_doc.file_url,
+        update_modified=False,
+    )
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    # spreadsheets store phone numbers as floats, e.g. 972501234567.0
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _recipient_rows(list_name: str, references: list[str]) -> list[tuple[str, str]]:
+    """Return ``(reference_name, row name)`` of the rows of ``list_name`` for ``references``."""
+
+    return frappe.get_all(
+        "WhatsApp Recipient",
+        filters={"parenttype": "WhatsApp Recipient List", "parent": list_name, "reference_name": ("in", references)},
+        fields=["reference_name", "name"],
+        as_list=True,
+    )
+
+
+def _remove_deleted(list_name: str, doctype: str, since: Any) -> int:
+    """Remove the rows whose source record was deleted after ``since``."""
+
+    chunk_size = get_import_chunk_size()
+    after = None
+    removed = 0
+
+    while True:
+        filters = [["Deleted Document", "deleted_doctype", "=", doctype], ["Deleted Document", "creation", ">", since]]
+        if after:
+            filters.append(["Deleted Document", "name", ">", after])
+        deleted = frappe.get_all("Deleted Document", filters=filters, fields=["name", "deleted_name"], order_by="name asc", limit=chunk_size)
+        if not deleted:
+            break
+        after = deleted[-1].name
+
+        rows = [row for _reference, row in _recipient_rows(list_name, [d.deleted_name for d in deleted])]
+        if rows:
+            frappe.db.delete("WhatsApp Recipient", {"name": ("in", rows)})
+            removed += len(rows)
+        frappe.db.commit()
+
+        if len(deleted) < chunk_size:
+            break
+
+    return removed
@@ -0,0 +1,127 @@
+"""Keyset-paginated access to campaign recipients.
+
+Recipients come from the campaign's own table, from the rows of a static
+WhatsApp Recipient List, or, for a dynamic segment, straight from the
+records of the segment's source doctype. Segment recipients are never
+stored: every page is read from the source when it is released.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+import frappe
+from frappe.utils import cint
+
+from frappe_whatsapp_waha.utils.recipient_import import (
+    DYNAMIC_SEGMENT,
+    build_recipient,
+    source_fields,
+    source_filters,
+)
+from frappe_whatsapp_waha.utils.phone import get_default_country_code
+
+RECIPIENT_FIELDS = ("name", "mobile_number", "recipient_name", "recipient_data")
+
+SEGMENT_FIELDS = ("list_type", "doctype_to_import", "mobile_field", "name_field", "import_filters", "data_fields")
+
+
+def get_chunk_size() -> int:
+    return max(cint(frappe.conf.get("whatsapp_campaign_chunk_size", 500)), 1)
+
+
+def get_recipient_source(campaign: Any) -> tuple[str, str]:
+    """Return ``(parenttype, parent)`` of the rows holding a campaign's recipients."""
+
+    if campaign.recipient_type == "Recipient List" and campaign.recipient_list:
+        return "WhatsApp Recipient List", campaign.recipient_list
+    return "Bulk WhatsApp Message", campaign.name
+
+
+def fetch_recipient_page(
+    parenttype: str,
+    parent: str,
+    *,
+    after: str | None = None,
+    limit: int | None = None,
+) -> list[frappe._dict]:
+    """Return the next ``limit`` recipients whose row name sorts after ``after``.
+
+    Pages are addressed by the last row name seen instead of an offset, so
+    every page costs the same index range scan however deep the cursor is.
+    """
+
+    if parenttype == "WhatsApp Recipient List":
+        segment = get_segment(parent)
+        if segment:
+            return fetch_segment_page(segment, after=after, limit=limit)
+
+    filters: dict[str, Any] = {"parenttype": parenttype, "parent": parent}
+    if after:
+        filters["name"] = (">", after)
+
+    return frappe.get_all(
+        "WhatsApp Recipient",
+        filters=filters,
+        fields=list(RECIPIENT_FIELDS),
+        order_by="name asc",
+        limit=limit or get_chunk_size(),
+    )
+
+
+def get_segment(list_name: str) -> frappe._dict | None:
+    """Return the query of ``list_name`` if it is a dynamic segment, else None."""
+
+    segment = frappe.db.get_value("WhatsApp Recipient List", list_name, SEGMENT_FIELDS, as_dict=True)
+    if not segment or segment.list_type != DYNAMIC_SEGMENT:
+        return None
+
+    segment.import_filters = json.loads(segment.import_filters) if segment.import_filters else None
+    segment.data_fields = json.loads(segment.data_fields) if segment.data_fields else None
+    return segment
+
+
+def fetch_segment_page(
+    segment: frappe._dict,
+    *,
+    after: str | None = None,
+    limit: int | None = None,
+) -> list[frappe._dict]:
+    """Return the next ``limit`` recipients of a dynamic segment.
+
+    Recipients are keyed by the name of their source record, which serves
+    as the page cursor and goes into the message idempotency key.
+    """
+
+    doctype = segment.doctype_to_import
+    records = frappe.get_all(
+        doctype,
+        filters=_segment_filters(segment, after),
+        fields=source_fields(doctype, segment.mobile_field, segment.name_field, segment.data_fields),
+        order_by="name asc",
+        limit=limit or get_chunk_size(),
+    )
+
+    country_code = get_default_country_code()
+    page = []
+    for record in records:
+        # an invalid number is kept and stored as Failed
+        recipient = build_recipient(record, segment.mobile_field, segment.name_field, segment.data_fields, country_code)
+        page.append(frappe._dict(recipient or {"mobile_number": None}, name=record.name))
+    return page
+
+
+def count_recipients(list_name: str) -> int:
+    """Return the number of recipients ``list_name`` currently holds or matches."""
+
+    segment = get_segment(list_name)
+    if segment:
+        return frappe.db.count(segment.doctype_to_import, filters=_segment_filters(segment, None))
+
+    return frappe.db.count("WhatsApp Recipient", {"parenttype": "WhatsApp Recipient List", "parent": list_name})
+
+
+def _segment_filters(segment: frappe._dict, after: str | None) -> list[list[Any]]:
+    doctype = segment.doctype_to_import
+    return [*source_filters(doctype, segment.import_filters, after), [doctype, segment.mobile_field, "is", "set"]]
@@ -0,0 +1,141 @@
+"""Opt-out list checked before every outgoing WhatsApp message.
+
+Each process keeps the suppressed numbers of a site in a set, so a check
+is one memoised normalisation and one set lookup. The set is loaded once
+and then kept current incrementally: every change to WhatsApp Suppression
+publishes a new version in Redis after it commits, and a process that sees
+a new version reads only the rows modified, and the Deleted Documents
+created, since its last refresh. The version is read at most every
+``whatsapp_suppression_refresh_interval`` seconds.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import time
+from typing import Any
+
+import frappe
+from frappe.utils import add_to_date, cint, cstr, now_datetime
+
+from frappe_whatsapp_waha.utils.phone import normalise
+
+VERSION_KEY = "whatsapp_suppression_version"
+DEFAULT_KEYWORDS = ("STOP", "UNSUBSCRIBE")
+
+# rows committed by a transaction that started before the last refresh are
+# still picked up by the next one
+REFRESH_OVERLAP = 300
+
+
+@dataclass(slots=True)
+class _Suppressed:
+    numbers: set[str]
+    version: Any
+    refreshed_at: Any
+    checked_at: float
+
+
+# site -> suppressed numbers of this process
+_suppressed: dict[str, _Suppressed] = {}
+
+
+def is_suppressed(number: Any) -> bool:
+    """Whether ``number`` has opted out or was suppressed by hand."""
+
+    if not number:
+        return False
+    return (normalise(number) or cstr(number).lstrip("+")) in _get_numbers()
+
+
+def add_suppression(number: Any, reason: str = "Manual", source_message: str | None = None) -> bool:
+    """Suppress ``number``; returns False if it is invalid or already suppressed."""
+
+    normalised = normalise(number)
+    if not normalised or frappe.db.exists("WhatsApp Suppression", normalised):
+        return False
+
+    frappe.get_doc(
+        {
+            "doctype": "WhatsApp Suppression",
+            "mobile_number": normalised,
+            "reason": reason,
+            "source_message": source_message,
+        }
+    ).insert(ignore_permissions=True)
+    return True
+
+
+def handle_opt_out(message: Any) -> bool:
+    """Suppress the sender of an incoming ``message`` that is an opt-out keyword."""
+
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    if not cint(settings.get("auto_suppress_opt_outs")):
+        return False
+
+    if cstr(message.message).strip().strip(".!").upper() not in get_opt_out_keywords():
+        return False
+    return add_suppression(message.get("from"), "Opted Out", message.name)
+
+
+def get_opt_out_keywords() -> frozenset[str]:
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    keywords = cstr(settings.get("opt_out_keywords")).splitlines() or DEFAULT_KEYWORDS
+    return frozenset(keyword.strip().upper() for keyword in keywords if keyword.strip())
+
+
+def publish_change() -> None:
+    """Make every process refresh its set once the current transaction commits."""
+
+    frappe.db.after_commit.add(_bump_version)
+
+
+def _get_numbers() -> set[str]:
+    state = _suppressed.get(frappe.local.site)
+    interval = cint(frappe.conf.get("whatsapp_suppression_refresh_interval", 5))
+    if state and time.monotonic() - state.checked_at < interval:
+        return state.numbers
+
+    version = frappe.cache().get_value(VERSION_KEY)
+    if state is None:
+        started_at = now_datetime()
+        state = _Suppressed(
+            set(frappe.get_all("WhatsApp Suppression", pluck="name")),
+            version,
+            started_at,
+            time.monotonic(),
+        )
+        _suppressed[frappe.local.site] = state
+    elif version != state.version:
+        _refresh(state)
+        state.version = version
+
+    state.checked_at = time.monotonic()
+    return state.numbers
+
+
+def _refresh(state: _Suppressed) -> None:
+    started_at = now_datetime()
+    since = add_to_date(state.refreshed_at, seconds=-REFRESH_OVERLAP)
+
+    state.numbers.update(frappe.get_all("WhatsApp Suppression", filters={"modified": (">=", since)}, pluck="name"))
+
+    deleted = frappe.get_all(
+        "Deleted Document",
+        filters={"deleted_doctype": "WhatsApp Suppression", "creation": (">=", since)},
+        pluck="deleted_name",
+    )
+    if deleted:
+        # a number may have been suppressed again after it was removed
+        current = set(frappe.get_all("WhatsApp Suppression", filters={"name": ("in", deleted)}, pluck="name"))
+        state.numbers.difference_update(set(deleted) - current)
+
+    state.refreshed_at = started_at
+
+
+def _bump_version() -> None:
+    frappe.cache().set_value(VERSION_KEY, frappe.generate_hash(length=10))
+    state = _suppressed.get(frappe.local.site)
+    if state:
+        # this process refreshes on its next check
+        state.checked_at = 0
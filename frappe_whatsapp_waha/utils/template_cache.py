@@ -0,0 +1,157 @@
+"""Per-process cache of compiled WhatsApp templates."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import partial
+import pickle
+import re
+from typing import Any, Sequence
+
+import frappe
+from frappe.utils import cstr, get_datetime
+
+VERSION_KEY = "whatsapp_template_versions"
+
+_PLACEHOLDER = re.compile(r"\{\{(\d+)\}\}")
+
+# site -> template name -> compiled template
+_templates: dict[str, dict[str, "CompiledTemplate"]] = {}
+
+
+@dataclass(slots=True, frozen=True)
+class CompiledText:
+    """Template text split into literals and ``{{n}}`` placeholders.
+
+    ``literals`` always holds one more entry than ``indices``; rendering
+    interleaves them, so the text is walked once whatever the number of
+    parameters.
+    """
+
+    literals: tuple[str, ...]
+    indices: tuple[int, ...]
+    placeholders: tuple[str, ...]
+
+    def render(self, parameters: Sequence[Any]) -> str:
+        """Substitute ``parameters`` (1-based in the template) in one pass.
+
+        Placeholders without a matching parameter are left untouched.
+        """
+
+        if not self.indices:
+            return self.literals[0]
+
+        count = len(parameters)
+        parts = [self.literals[0]]
+        for index, placeholder, literal in zip(self.indices, self.placeholders, self.literals[1:]):
+            parts.append(cstr(parameters[index]) if 0 <= index < count else placeholder)
+            parts.append(literal)
+        return "".join(parts)
+
+
+@dataclass(slots=True, frozen=True)
+class CompiledTemplate:
+    """The fields of a WhatsApp Templates document needed to send it."""
+
+    name: str
+    version: str
+    actual_name: str | None
+    language_code: str | None
+    category: str | None
+    header_type: str | None
+    header: CompiledText | None
+    body: CompiledText
+    footer: str | None
+    sample: str | None
+    sample_values: str | None
+    parameter_fields: tuple[str, ...]
+
+
+def compile_text(text: str | None) -> CompiledText:
+    """Build the placeholder index for ``text``."""
+
+    text = text or ""
+    literals: list[str] = []
+    indices: list[int] = []
+    placeholders: list[str] = []
+    position = 0
+
+    for match in _PLACEHOLDER.finditer(text):
+        literals.append(text[position:match.start()])
+        indices.append(int(match.group(1)) - 1)
+        placeholders.append(match.group(0))
+        position = match.end()
+
+    literals.append(text[position:])
+    return CompiledText(tuple(literals), tuple(indices), tuple(placeholders))
+
+
+def compile_template(doc) -> CompiledTemplate:
+    """Compile a WhatsApp Templates document."""
+
+    field_source = doc.field_names or doc.sample_values or ""
+    parameter_fields = tuple(field.strip() for field in field_source.split(",")) if doc.sample_values else ()
+
+    return CompiledTemplate(
+        name=doc.name,
+        version=_version(doc.modified),
+        actual_name=doc.actual_name,
+        language_code=doc.language_code,
+        category=doc.category,
+        header_type=doc.header_type,
+        header=compile_text(doc.header) if doc.header else None,
+        body=compile_text(doc.template),
+        footer=doc.footer,
+        sample=doc.sample,
+        sample_values=doc.sample_values,
+        parameter_fields=parameter_fields,
+    )
+
+
+def get_compiled_template(name: str) -> CompiledTemplate:
+    """Return the compiled template ``name``, loading it at most once per save.
+
+    Each process keeps its compiled copy and checks it against the version
+    published in Redis when the template is saved.
+    """
+
+    site_templates = _templates.setdefault(frappe.local.site, {})
+    version = frappe.cache().hget(VERSION_KEY, name)
+    compiled = site_templates.get(name)
+
+    if compiled and compiled.version == version:
+        return compiled
+
+    compiled = compile_template(frappe.get_doc("WhatsApp Templates", name))
+    site_templates[name] = compiled
+
+    if version is None:
+        # only if still unset: a save may have published a newer version
+        # since the document was read
+        cache = frappe.cache()
+        cache.hsetnx(cache.make_key(VERSION_KEY), name, pickle.dumps(compiled.version))
+
+    return compiled
+
+
+def invalidate_template(name: str, version: Any = None) -> None:
+    """Publish the new version of template ``name`` to every process.
+
+    The version is published once the current transaction commits, so a
+    rolled back save never points the other processes at a version that
+    does not exist.
+    """
+
+    _templates.get(frappe.local.site, {}).pop(name, None)
+    frappe.db.after_commit.add(partial(_publish_version, name, None if version is None else _version(version)))
+
+
+def _publish_version(name: str, version: str | None) -> None:
+    if version is None:
+        frappe.cache().hdel(VERSION_KEY, name)
+    else:
+        frappe.cache().hset(VERSION_KEY, name, version)
+
+
+def _version(modified: Any) -> str:
+    return get_datetime(modified).strftime("%Y-%m-%d %H:%M:%S.%f")
@@ -0,0 +1,60 @@
+"""Tests for phone number normalisation."""
+
+from __future__ import annotations
+
+from frappe.tests import UnitTestCase
+
+from frappe_whatsapp_waha.utils.phone import as_chat_id, deduplicate, normalise
+
+
+class TestPhone(UnitTestCase):
+    def test_normalise_national_number(self):
+        self.assertEqual(normalise("0501234567", "972"), "972501234567")
+        self.assertEqual(normalise("(050) 123-4567", "972"), "972501234567")
+        # without a default country code a national number cannot be placed
+        self.assertIsNone(normalise("0501234567", ""))
+
+    def test_normalise_international_number(self):
+        self.assertEqual(normalise("+972 50-123-4567", "1"), "972501234567")
+        self.assertEqual(normalise("00972501234567", "1"), "972501234567")
+        self.assertEqual(normalise("972501234567", "1"), "972501234567")
+        self.assertIsNone(normalise("+0501234567", "972"))
+
+    def test_normalise_whatsapp_ids(self):
+        self.assertEqual(normalise("972501234567@c.us", ""), "972501234567")
+        self.assertEqual(normalise("972501234567:12@s.whatsapp.net", ""), "972501234567")
+
+    def test_normalise_length_bounds(self):
+        self.assertIsNone(normalise("1234567", ""))
+        self.assertEqual(normalise("12345678", ""), "12345678")
+        self.assertEqual(normalise("123456789012345", ""), "123456789012345")
+        self.assertIsNone(normalise("1234567890123456", ""))
+
+    def test_normalise_invalid_input(self):
+        self.assertIsNone(normalise("", "972"))
+        self.assertIsNone(normalise(None, "972"))
+        self.assertIsNone(normalise("call me", "972"))
+        self.assertIsNone(normalise("+972 50 123 4567 ext 5", "972"))
+
+    def test_as_chat_id(self):
+        self.assertEqual(as_chat_id("0501234567", "972"), "972501234567@c.us")
+        self.assertEqual(as_chat_id("120363025@g.us", "972"), "120363025@g.us")
+
+    def test_deduplicate_on_normalised_number(self):
+        recipients = [
+            {"mobile_number": "050-123-4567"},
+            {"mobile_number": "+972501234567"},
+            {"mobile_number": "972501234567@c.us"},
+            {"mobile_number": "call me"},
+            {"mobile_number": " call me "},
+        ]
+        self.assertEqual(
+            list(deduplicate(recipients, country_code="972")),
+            [{"mobile_number": "050-123-4567"}, {"mobile_number": "call me"}],
+        )
+
+    def test_deduplicate_across_calls(self):
+        seen = set()
+        self.assertEqual(len(list(deduplicate([{"mobile_number": "+15550100123"}], seen, country_code="1"))), 1)
+        self.assertEqual(list(deduplicate([{"mobile_number": "0015550100123"}], seen, country_code="1")), [])
+        self.assertEqual(seen, {"15550100123"})
@@ -11,6 +11,9 @@ from frappe import _
 from frappe_whatsapp_waha.frappe_whatsapp_waha.doctype.whatsapp_settings.whatsapp_settings import (
     build_waha_webhook_url,
 )
+from frappe_whatsapp_waha.utils.message_status import advance
+from frappe_whatsapp_waha.utils.phone import normalise
+from frappe_whatsapp_waha.utils.suppression import handle_opt_out
 
 
 def _extract_payload() -> Any:
@@ -38,14 +41,9 @@ def _normalise_phone(jid: str | None) -> str | None:
     if not isinstance(jid, str) or not jid:
         return None
 
-    number = jid
-    if "@" in number:
-        number = number.split("@", 1)[0]
-
-    if number.startswith("+"):
-        number = number[1:]
-
-    return number
+    # sender ids are always international; group and linked-device ids
+    # that are not phone numbers are kept as they are
+    return normalise(jid, "") or jid.split("@", 1)[0].lstrip("+")
 
 
 def _unwrap_layers(message: dict[str, Any]) -> dict[str, Any]:
@@ -275,6 +273,7 @@ def _create_incoming_message(message: dict[str, Any], push_name: str | None = No
         doc["message"] = f"{doc['message']} ({parsed['extra']})".strip()
 
     inserted = frappe.get_doc(doc).insert(ignore_permissions=True)
+    handle_opt_out(inserted)
 
     attachment = parsed.get("attachment")
     if attachment:
@@ -313,17 +312,38 @@ def _handle_messages_update(payload: dict[str, Any]) -> None:
         if not message_id:
             continue
 
-        status = (update.get("update") or {}).get("status") or update.get("status")
-        if not status:
+        status = (update.get("update") or {}).get("status")
+        if status is None:
+            status = update.get("status")
+        if status is None or status == "":
             continue
 
-        name = frappe.db.get_value("WhatsApp Message", {"message_id": message_id}, "name")
-        if not name:
-            continue
+        _update_message_status(message_id, status)
+
+
+def _handle_message_ack(payload: dict[str, Any]) -> None:
+    if not isinstance(payload, dict):
+        return
+
+    message_id = payload.get("id")
+    # the numeric ack differs between engines, its name does not
+    status = payload.get("ackName")
+    if message_id and status:
+        _update_message_status(message_id, status)
+
+
+def _update_message_status(message_id: str, status: Any) -> None:
+    name = frappe.db.get_value("WhatsApp Message", {"message_id": message_id}, "name")
+    if not name:
+        return
+
+    doc = frappe.get_doc("WhatsApp Message", name)
+    new_status = advance(doc.status, status)
+    if new_status == doc.status:
+        return
 
-        doc = frappe.get_doc("WhatsApp Message", name)
-        doc.status = status
-        doc.save(ignore_permissions=True)
+    doc.status = new_status
+    doc.save(ignore_permissions=True)
 
 
 @frappe.whitelist(allow_guest=True)
@@ -357,6 +377,8 @@ def webhook(session: str | None = None) -> dict[str, Any]:
         _handle_messages_upsert(data or payload)
     elif event == "messages.update":
         _handle_messages_update(data or payload)
+    elif event == "message.ack":
+        _handle_message_ack(payload.get("payload") or data)
     elif isinstance(payload, dict) and payload.get("messages"):
         _handle_messages_upsert(payload)
 